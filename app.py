@@ -1,9 +1,9 @@
 # app.py - Основной файл сервера
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
 import pymongo
-from pymongo import MongoClient
+from pymongo import UpdateOne
 import bcrypt
 import base58
 from solana.keypair import Keypair
@@ -13,10 +13,18 @@ import time
 import json
 import os
 from dotenv import load_dotenv
-import requests
 import uuid
 from datetime import datetime
 
+from token_registry import TokenRegistry
+from position_scheduler import position_scheduler
+from user_cache import active_user_cache
+from storage import storage
+from models import ensure_indexes, check_query_plans, keyset_find, encode_cursor, PAGE_SIZE_LIMIT
+from rate_limiter import rate_limiter
+from http_client import http_client, is_upstream_error, is_upstream_status, is_local_timeout
+from circuit_breaker import CircuitBreaker, NegativeCache
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -25,9 +33,8 @@ app = Flask(__name__)
 CORS(app)  # Включаем CORS для API
 PORT = int(os.environ.get("PORT", 5000))
 
-# Подключение к MongoDB
-client = MongoClient(os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"))
-db = client["solana_bot_db"]
+# Хранилище данных (MongoDB или in-memory, см. STORAGE_BACKEND); подключение к MongoDB - при первом запросе
+db = storage
 users_collection = db["users"]
 transactions_collection = db["transactions"]
 tokens_collection = db["tokens"]
@@ -42,6 +49,22 @@ class Config:
     PURCHASE_AMOUNT_SOL = 0.05  # Количество SOL для покупки
     MAX_HOLDING_TIME = 3600  # Максимальное время удержания токена в секундах (1 час)
     CHECK_INTERVAL = 5  # Интервал проверки токенов в секундах
+    REGISTRY_MAX_SIZE = 10000  # Максимальное количество отслеживаемых токенов
+    TOKEN_TTL = 86400  # Максимальное время отслеживания токена в секундах
+    TOKEN_INACTIVITY_TIMEOUT = 3600  # Время без изменения процента миграции до вытеснения токена
+    TERMINAL_TOKEN_TTL = 86400  # Время хранения завершенных токенов в секундах
+    BREAKER_FAILURE_THRESHOLD = 20  # Сбоев API платформы подряд до приостановки проверок
+    BREAKER_RECOVERY_TIMEOUT = 30  # Пауза перед пробным запросом к API платформы в секундах
+    NEGATIVE_CACHE_BASE_DELAY = 10  # Начальная задержка повторной проверки токена после сбоя в секундах
+    NEGATIVE_CACHE_MAX_DELAY = 1800  # Максимальная задержка повторной проверки токена в секундах
+    API_PAGE_SIZE = 100  # Размер страницы списков API по умолчанию
+
+# Автоматы отключения API платформ и отрицательный кэш токенов, проверка которых не удается
+breakers = {
+    platform: CircuitBreaker(platform, Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RECOVERY_TIMEOUT)
+    for platform in ("pump.fun", "raydium")
+}
+negative_cache = NegativeCache(Config.NEGATIVE_CACHE_BASE_DELAY, Config.NEGATIVE_CACHE_MAX_DELAY)
 
 # Функция для создания кошелька Solana
 def create_solana_wallet():
@@ -165,7 +188,8 @@ def create_user(user):
         "telegram_chat_id": telegram_chat_id,
         "language": language,
         "active": True,
-        "created_at": datetime.now()
+        "created_at": datetime.now(),
+        "updated_at": datetime.now()
     }
     
     result = users_collection.insert_one(new_user)
@@ -185,7 +209,7 @@ def create_user(user):
 @auth_required
 @admin_required
 def get_users(user):
-    users = list(users_collection.find({}, {
+    projection = {
         "username": 1, 
         "role": 1, 
         "wallet_address": 1, 
@@ -193,13 +217,39 @@ def get_users(user):
         "created_at": 1, 
         "telegram_chat_id": 1, 
         "language": 1
-    }))
+    }
+    
+    # Выгрузка всех пользователей построчно (NDJSON) прямо из курсора, без накопления в памяти
+    if request.args.get("format") == "ndjson":
+        cursor = keyset_find(users_collection, {}, projection=projection)
+        return Response(stream_with_context(ndjson_lines(cursor)), mimetype="application/x-ndjson")
+    
+    # Постраничная выдача: следующая страница запрашивается с ?after=<next_cursor>
+    try:
+        limit = min(max(1, int(request.args.get("limit", Config.API_PAGE_SIZE))), PAGE_SIZE_LIMIT)
+        users = list(keyset_find(users_collection, {}, after=request.args.get("after"), limit=limit, projection=projection))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    next_cursor = encode_cursor(users[-1]) if len(users) == limit else None
     
     # Преобразуем ObjectId в строки для JSON
     for user in users:
         user["_id"] = str(user["_id"])
     
-    return jsonify({"success": True, "users": users})
+    return jsonify({"success": True, "users": users, "next_cursor": next_cursor})
+
+def ndjson_lines(cursor):
+    """Документы курсора в виде строк JSON (ObjectId и даты - строками)"""
+    for document in cursor:
+        yield json.dumps(document, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value), ensure_ascii=False) + "\n"
+
+# Метрики внешних запросов: ограничение частоты по хостам (только администратор)
+@app.route('/api/metrics', methods=['GET'], endpoint='get_metrics')
+@auth_required
+@admin_required
+def get_metrics(user):
+    return jsonify({"success": True, "rate_limiter": rate_limiter.metrics()})
 
 # Функция для проверки миграции токена на pump.fun
 def check_token_migration(token_address):
@@ -207,7 +257,7 @@ def check_token_migration(token_address):
         # URL API pump.fun (заменить на реальный URL)
         api_url = f"https://api.pump.fun/tokens/{token_address}"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -218,10 +268,12 @@ def check_token_migration(token_address):
                     "above_threshold": data["migrationPercentage"] >= Config.MIGRATION_THRESHOLD
                 }
         
+        # 404 и ответ без процента - проблема токена; 429 и 5xx - сбой API
         return {
             "success": False,
             "migration_percentage": 0,
-            "above_threshold": False
+            "above_threshold": False,
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при проверке миграции токена {token_address}: {str(e)}")
@@ -229,6 +281,8 @@ def check_token_migration(token_address):
             "success": False,
             "migration_percentage": 0,
             "above_threshold": False,
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
@@ -238,7 +292,7 @@ def check_raydium_token_migration(token_address):
         # URL API Raydium (заменить на реальный URL)
         api_url = f"https://api.raydium.io/tokens/{token_address}"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -249,10 +303,12 @@ def check_raydium_token_migration(token_address):
                     "above_threshold": data["migrationPercentage"] >= Config.MIGRATION_THRESHOLD
                 }
         
+        # 404 и ответ без процента - проблема токена; 429 и 5xx - сбой API
         return {
             "success": False,
             "migration_percentage": 0,
-            "above_threshold": False
+            "above_threshold": False,
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при проверке миграции токена Raydium {token_address}: {str(e)}")
@@ -260,6 +316,8 @@ def check_raydium_token_migration(token_address):
             "success": False,
             "migration_percentage": 0,
             "above_threshold": False,
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
@@ -269,7 +327,7 @@ def get_new_pumpfun_tokens():
         # URL API для получения новых токенов (заменить на реальный URL)
         api_url = "https://api.pump.fun/tokens/new"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -297,7 +355,7 @@ def get_new_raydium_tokens():
         # URL API для получения новых токенов (заменить на реальный URL)
         api_url = "https://api.raydium.io/tokens/new"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -386,12 +444,82 @@ def sell_token(wallet, token_address, token_amount, target_profit_percentage):
             "error": str(e)
         }
 
+# Функция для добавления новых токенов из ленты платформы (один bulk_write на страницу ленты)
+def add_new_tokens(tracked_tokens, tokens, platform):
+    # Убираем уже отслеживаемые токены и повторы внутри страницы ленты
+    new_tokens = {}
+    for token in tokens:
+        if token["address"] not in tracked_tokens and token["address"] not in new_tokens:
+            new_tokens[token["address"]] = token
+    
+    if not new_tokens:
+        return 0
+    
+    # Добавляем токены в БД
+    now = datetime.now()
+    operations = [
+        UpdateOne(
+            {"address": token["address"]},
+            {
+                "$set": {
+                    "name": token["name"],
+                    "symbol": token["symbol"],
+                    "platform": platform
+                },
+                # Статус существующей записи не сбрасывается: купленный токен не должен снова стать отслеживаемым
+                "$setOnInsert": {
+                    "last_migration_percentage": 0,
+                    "time_added": now,
+                    "status": "tracking"
+                }
+            },
+            upsert=True
+        )
+        for token in new_tokens.values()
+    ]
+    
+    db_started = time.perf_counter()
+    result = tokens_collection.bulk_write(operations, ordered=False)
+    
+    # Уже купленные или завершенные токены запоминаем в реестре и не отслеживаем повторно
+    if result.upserted_count < len(new_tokens):
+        finished = tokens_collection.find(
+            {"address": {"$in": list(new_tokens)}, "status": {"$ne": "tracking"}},
+            {"_id": 0, "address": 1, "status": 1}
+        )
+        for token in finished:
+            tracked_tokens.mark_terminal(token["address"], token["status"])
+            del new_tokens[token["address"]]
+    db_time = time.perf_counter() - db_started
+    
+    for token in new_tokens.values():
+        # Добавляем в отслеживаемые
+        tracked_tokens.add(token["address"], {
+            "name": token["name"],
+            "symbol": token["symbol"],
+            "platform": platform,
+            "last_migration_percentage": 0,
+            "time_added": now,
+            "status": "tracking"
+        })
+        
+        print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
+    
+    print(f"Новых токенов {platform}: {len(new_tokens)}, запись в БД: {db_time * 1000:.1f} мс")
+    
+    return len(new_tokens)
+
 # Функция для мониторинга токенов
 def monitor_tokens():
     print("Запуск мониторинга токенов...")
     
-    # Словарь для отслеживания токенов
-    tracked_tokens = {}
+    # Реестр отслеживаемых токенов
+    tracked_tokens = TokenRegistry(
+        Config.REGISTRY_MAX_SIZE,
+        Config.TOKEN_TTL,
+        Config.TOKEN_INACTIVITY_TIMEOUT,
+        Config.TERMINAL_TOKEN_TTL
+    )
     
     # Время последней проверки новых токенов
     last_new_tokens_check = 0
@@ -405,66 +533,33 @@ def monitor_tokens():
                 # Получаем новые токены с pump.fun
                 pump_tokens = get_new_pumpfun_tokens()
                 if pump_tokens["success"]:
-                    for token in pump_tokens["tokens"]:
-                        if token["address"] not in tracked_tokens:
-                            # Добавляем токен в БД
-                            tokens_collection.update_one(
-                                {"address": token["address"]},
-                                {"$set": {
-                                    "name": token["name"],
-                                    "symbol": token["symbol"],
-                                    "platform": "pump.fun",
-                                    "last_migration_percentage": 0,
-                                    "time_added": datetime.now(),
-                                    "status": "tracking"
-                                }},
-                                upsert=True
-                            )
-                            
-                            # Добавляем в отслеживаемые
-                            tracked_tokens[token["address"]] = {
-                                "name": token["name"],
-                                "symbol": token["symbol"],
-                                "platform": "pump.fun",
-                                "last_migration_percentage": 0,
-                                "time_added": datetime.now(),
-                                "status": "tracking"
-                            }
-                            
-                            print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
+                    add_new_tokens(tracked_tokens, pump_tokens["tokens"], "pump.fun")
                 
                 # Получаем новые токены с Raydium
                 raydium_tokens = get_new_raydium_tokens()
                 if raydium_tokens["success"]:
-                    for token in raydium_tokens["tokens"]:
-                        if token["address"] not in tracked_tokens:
-                            # Добавляем токен в БД
-                            tokens_collection.update_one(
-                                {"address": token["address"]},
-                                {"$set": {
-                                    "name": token["name"],
-                                    "symbol": token["symbol"],
-                                    "platform": "raydium",
-                                    "last_migration_percentage": 0,
-                                    "time_added": datetime.now(),
-                                    "status": "tracking"
-                                }},
-                                upsert=True
-                            )
-                            
-                            # Добавляем в отслеживаемые
-                            tracked_tokens[token["address"]] = {
-                                "name": token["name"],
-                                "symbol": token["symbol"],
-                                "platform": "raydium",
-                                "last_migration_percentage": 0,
-                                "time_added": datetime.now(),
-                                "status": "tracking"
-                            }
-                            
-                            print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
+                    add_new_tokens(tracked_tokens, raydium_tokens["tokens"], "raydium")
                 
                 last_new_tokens_check = current_time
+                
+                # Вытесняем устаревшие и застывшие токены
+                evicted_tokens = tracked_tokens.evict_expired()
+                for token_address in evicted_tokens:
+                    tokens_collection.update_one(
+                        {"address": token_address},
+                        {"$set": {"status": "expired"}}
+                    )
+                
+                if evicted_tokens:
+                    print(f"Вытеснено токенов: {len(evicted_tokens)}, статистика реестра: {tracked_tokens.stats()}")
+                
+                # Токены, вытесненные из переполненного реестра при добавлении новых
+                evicted_tokens = tracked_tokens.pop_capacity_evicted()
+                if evicted_tokens:
+                    tokens_collection.update_many(
+                        {"address": {"$in": evicted_tokens}},
+                        {"$set": {"status": "evicted"}}
+                    )
             
             # Проверяем миграцию для каждого отслеживаемого токена
             for token_address, token_info in list(tracked_tokens.items()):
@@ -472,6 +567,11 @@ def monitor_tokens():
                 if token_info["status"] != "tracking":
                     continue
                 
+                # API платформы недоступно или проверка токена отложена после сбоев
+                breaker = breakers.get(token_info["platform"])
+                if breaker is None or token_address in negative_cache or not breaker.allow():
+                    continue
+                
                 # Проверяем миграцию в зависимости от платформы
                 migration_result = None
                 if token_info["platform"] == "pump.fun":
@@ -479,9 +579,22 @@ def monitor_tokens():
                 elif token_info["platform"] == "raydium":
                     migration_result = check_raydium_token_migration(token_address)
                 
+                # Сбой API учитывается автоматом платформы, сбой токена - отрицательным кэшем
+                if migration_result["success"]:
+                    breaker.record_success()
+                    negative_cache.record_success(token_address)
+                elif migration_result.get("upstream_error"):
+                    breaker.record_failure()
+                elif migration_result.get("local_timeout"):
+                    # Таймаут на нашей стороне: ни успех API, ни сбой токена
+                    pass
+                else:
+                    breaker.record_success()
+                    negative_cache.record_failure(token_address)
+                
                 if migration_result and migration_result["success"]:
                     # Обновляем процент миграции
-                    token_info["last_migration_percentage"] = migration_result["migration_percentage"]
+                    tracked_tokens.touch(token_address, migration_result["migration_percentage"])
                     
                     # Обновляем в БД
                     tokens_collection.update_one(
@@ -501,8 +614,8 @@ def monitor_tokens():
                             {"$set": {"status": "buying"}}
                         )
                         
-                        # Получаем всех активных пользователей
-                        active_users = list(users_collection.find({"active": True}))
+                        # Получаем всех активных пользователей из кэша
+                        active_users = active_user_cache.get_all()
                         
                         for user in active_users:
                             wallet = {
@@ -546,7 +659,10 @@ def monitor_tokens():
                                 # Запланируем продажу токена через некоторое время
                                 # В реальности это должно быть более сложным механизмом с проверкой цены
                                 # Для примера продаем через 60 секунд
-                                threading.Timer(60, sell_token_for_user, args=[user, token_address, purchase_result["token_amount"], Config.TARGET_PROFIT]).start()
+                                position_scheduler.schedule(60, sell_token_for_user, user, token_address, purchase_result["token_amount"], Config.TARGET_PROFIT)
+                        
+                        # Убираем токен из живых, чтобы не проверять его повторно
+                        tracked_tokens.mark_terminal(token_address, token_info["status"])
             
             # Спим перед следующей проверкой
             time.sleep(Config.CHECK_INTERVAL)
@@ -647,7 +763,8 @@ def create_admin_if_not_exists():
                 "wallet_address": wallet["address"],
                 "wallet_private_key": wallet["private_key"],
                 "active": True,
-                "created_at": datetime.now()
+                "created_at": datetime.now(),
+                "updated_at": datetime.now()
             }
             
             users_collection.insert_one(admin_user)
@@ -657,6 +774,10 @@ def create_admin_if_not_exists():
 
 # Запуск сервера
 if __name__ == "__main__":
+    # Создаем индексы и проверяем, что запросы горячего пути их используют
+    ensure_indexes()
+    check_query_plans()
+    
     # Создаем админа, если его нет
     create_admin_if_not_exists()
     
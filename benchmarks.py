@@ -0,0 +1,218 @@
+# benchmarks.py - Замеры производительности отдельных участков бота
+
+import argparse
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+from storage import create_storage
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Отдельная база для замеров, чтобы не трогать рабочие данные
+BENCH_DB_NAME = "solana_bot_bench"
+
+def make_fake_tokens(count):
+    """Генерация страницы ленты новых токенов"""
+    return [
+        {
+            "address": uuid.uuid4().hex + uuid.uuid4().hex[:12],
+            "name": f"Bench Token {i}",
+            "symbol": f"B{i}"
+        }
+        for i in range(count)
+    ]
+
+def bench_discovery(page_size, pages, backend=None):
+    """Время записи в БД на страницу ленты: поиск и вставка по одному против одного bulk_write"""
+    from models import Token, INDEXES
+
+    db = create_storage(backend or os.environ.get("STORAGE_BACKEND"), database_name=BENCH_DB_NAME)
+    original_collection = Token.collection
+    Token.collection = db["tokens"]
+
+    try:
+        results = {}
+
+        # Прежний путь: find_by_address + create на каждый токен
+        Token.collection.drop()
+        Token.collection.create_indexes(INDEXES["tokens"])
+        started = time.perf_counter()
+        for _ in range(pages):
+            for token in make_fake_tokens(page_size):
+                if not Token.find_by_address(token["address"]):
+                    Token.create(token["address"], token["name"], token["symbol"], "pump.fun", 0, "tracking")
+        results["per_token"] = (time.perf_counter() - started) / pages
+
+        # Новый путь: один неупорядоченный bulk_write на страницу
+        Token.collection.drop()
+        Token.collection.create_indexes(INDEXES["tokens"])
+        started = time.perf_counter()
+        for _ in range(pages):
+            Token.bulk_create_missing(make_fake_tokens(page_size), "pump.fun")
+        results["bulk"] = (time.perf_counter() - started) / pages
+
+        print(f"Страница ленты: {page_size} токенов, страниц: {pages}")
+        print(f"  по одному:  {results['per_token'] * 1000:.1f} мс на страницу")
+        print(f"  bulk_write: {results['bulk'] * 1000:.1f} мс на страницу")
+        return results
+    finally:
+        Token.collection = original_collection
+        db["tokens"].drop()
+
+def bench_signing(iterations, wallets):
+    """Задержка подписи перевода с расшифровкой ключа на каждый вызов и с кэшем Keypair"""
+    from base58 import b58encode, b58decode
+    from solana.keypair import Keypair
+    from solana.publickey import PublicKey
+    from solana.system_program import TransferParams, transfer
+    from solana.transaction import Transaction
+    import solana_service
+
+    # Набор кошельков, как при одновременной покупке для нескольких пользователей
+    keypairs = [Keypair() for _ in range(wallets)]
+    users = [
+        (str(keypair.public_key), b58encode(keypair.secret_key).decode("ascii"))
+        for keypair in keypairs
+    ]
+    destination = PublicKey(str(Keypair().public_key))
+    blockhash = "11111111111111111111111111111111"
+
+    def sign(keypair):
+        transaction = Transaction().add(transfer(TransferParams(
+            from_pubkey=keypair.public_key,
+            to_pubkey=destination,
+            lamports=1000
+        )))
+        transaction.recent_blockhash = blockhash
+        transaction.sign(keypair)
+
+    results = {}
+
+    # Без кэша: base58 и разворачивание ключа на каждую подпись
+    started = time.perf_counter()
+    for i in range(iterations):
+        address, private_key = users[i % wallets]
+        sign(Keypair.from_secret_key(b58decode(private_key)))
+    results["uncached"] = (time.perf_counter() - started) / iterations
+
+    # С кэшем по адресу кошелька
+    solana_service.invalidate_keypair()
+    started = time.perf_counter()
+    for i in range(iterations):
+        address, private_key = users[i % wallets]
+        sign(solana_service.get_keypair(private_key, address))
+    results["cached"] = (time.perf_counter() - started) / iterations
+
+    print(f"Подпись перевода: {iterations} подписей, кошельков: {wallets}")
+    print(f"  без кэша: {results['uncached'] * 1e6:.1f} мкс на подпись")
+    print(f"  с кэшем:  {results['cached'] * 1e6:.1f} мкс на подпись")
+    print(f"  статистика кэша: {solana_service.get_keypair_cache_stats()}")
+    return results
+
+def bench_token_accounts(accounts_count, iterations):
+    """Разбор ответа getTokenAccountsByOwner: jsonParsed против base64 с разбором раскладки"""
+    import base64
+    import json
+    from base58 import b58encode
+    import solana_service
+
+    # Синтетический кошелек с accounts_count аккаунтами SPL-токенов в обеих кодировках
+    owner = b58encode(os.urandom(32)).decode("ascii")
+    owner_bytes = solana_service.b58decode(owner)
+    parsed_accounts = []
+    raw_accounts = []
+    decimals_by_mint = {}
+
+    for i in range(accounts_count):
+        mint_bytes = os.urandom(32)
+        mint = b58encode(mint_bytes).decode("ascii")
+        pubkey = b58encode(os.urandom(32)).decode("ascii")
+        amount = (i + 1) * 1234567
+        decimals = 6 if i % 2 else 9
+        decimals_by_mint[mint] = decimals
+
+        common = {"executable": False, "lamports": 2039280, "owner": solana_service.TOKEN_PROGRAM_ID, "rentEpoch": 0, "space": 165}
+        parsed_accounts.append({"pubkey": pubkey, "account": dict(common, data={
+            "program": "spl-token",
+            "parsed": {
+                "info": {
+                    "isNative": False,
+                    "mint": mint,
+                    "owner": owner,
+                    "state": "initialized",
+                    "tokenAmount": {
+                        "amount": str(amount),
+                        "decimals": decimals,
+                        "uiAmount": amount / 10 ** decimals,
+                        "uiAmountString": str(amount / 10 ** decimals)
+                    }
+                },
+                "type": "account"
+            },
+            "space": 165
+        })})
+
+        data = solana_service.SPL_TOKEN_ACCOUNT_LAYOUT.pack(mint_bytes, owner_bytes, amount)
+        data += bytes(solana_service.SPL_TOKEN_ACCOUNT_SIZE - len(data))
+        raw_accounts.append({"pubkey": pubkey, "account": dict(common, data=[base64.b64encode(data).decode("ascii"), "base64"])})
+
+    parsed_payload = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"value": parsed_accounts}})
+    raw_payload = json.dumps({"jsonrpc": "2.0", "id": 1, "result": {"value": raw_accounts}})
+
+    # Оба пути должны возвращать одинаковые поля
+    fields = ("pubkey", "mint", "owner", "amount", "decimals", "uiAmount")
+    expected = [
+        tuple(account[field] for field in fields)
+        for account in solana_service.parse_token_accounts_json(json.loads(parsed_payload)["result"]["value"])
+    ]
+    decoded = [
+        tuple(account[field] for field in fields)
+        for account in solana_service.decode_token_accounts(json.loads(raw_payload)["result"]["value"], decimals_by_mint)
+    ]
+    assert decoded == expected, "Результаты разбора base64 и jsonParsed различаются"
+
+    results = {}
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        solana_service.parse_token_accounts_json(json.loads(parsed_payload)["result"]["value"])
+    results["json_parsed"] = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        solana_service.decode_token_accounts(json.loads(raw_payload)["result"]["value"], decimals_by_mint)
+    results["raw"] = (time.perf_counter() - started) / iterations
+
+    print(f"Аккаунты SPL-токенов: {accounts_count} на кошелек, повторов: {iterations}")
+    print(f"  jsonParsed: {len(parsed_payload) / 1024:.0f} КБ ответа, {results['json_parsed'] * 1000:.2f} мс на разбор")
+    print(f"  base64:     {len(raw_payload) / 1024:.0f} КБ ответа, {results['raw'] * 1000:.2f} мс на разбор")
+    return results
+
+# Запуск замеров из командной строки
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    discovery_parser = subparsers.add_parser("discovery", help="Запись новых токенов в БД (MONGODB_URI)")
+    discovery_parser.add_argument("--page-size", type=int, default=200)
+    discovery_parser.add_argument("--pages", type=int, default=5)
+    discovery_parser.add_argument("--storage", choices=["mongo", "memory"], help="Хранилище (по умолчанию STORAGE_BACKEND)")
+
+    signing_parser = subparsers.add_parser("signing", help="Подпись транзакций с кэшем Keypair и без него")
+    signing_parser.add_argument("--iterations", type=int, default=5000)
+    signing_parser.add_argument("--wallets", type=int, default=100)
+
+    accounts_parser = subparsers.add_parser("token-accounts", help="Разбор аккаунтов SPL-токенов: jsonParsed и base64")
+    accounts_parser.add_argument("--accounts", type=int, default=500)
+    accounts_parser.add_argument("--iterations", type=int, default=50)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "discovery":
+        bench_discovery(args.page_size, args.pages, args.storage)
+    elif args.benchmark == "signing":
+        bench_signing(args.iterations, args.wallets)
+    elif args.benchmark == "token-accounts":
+        bench_token_accounts(args.accounts, args.iterations)
@@ -0,0 +1,93 @@
+# buy_fanout.py - Параллельная покупка токена для всех активных пользователей
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+class BuyFanout:
+    """Покупки всех пользователей запускаются одновременно; запись в БД и уведомления выполняются в фоне"""
+
+    def __init__(self, max_workers=64, post_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="buy")
+        self.post_executor = ThreadPoolExecutor(max_workers=post_workers, thread_name_prefix="buy-post")
+
+    @staticmethod
+    def _timed(buy_function, user, started):
+        """Покупка для одного пользователя с замером задержки"""
+        call_started = time.perf_counter()
+        try:
+            result = buy_function(user)
+        except Exception as e:
+            print(f"Ошибка при покупке для пользователя {user.get('username')}: {str(e)}")
+            result = {"success": False, "error": str(e)}
+        finished = time.perf_counter()
+
+        # Длительность самой покупки и время от начала раздачи до ее завершения
+        return result, finished - call_started, finished - started
+
+    @staticmethod
+    def _percentile(values, percent):
+        """Перцентиль отсортированного списка"""
+        if not values:
+            return 0
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
+
+    def _post(self, post_function, user, result):
+        """Запись и уведомление вне критического пути"""
+        try:
+            post_function(user, result)
+        except Exception as e:
+            print(f"Ошибка при обработке покупки для пользователя {user.get('username')}: {str(e)}")
+
+    def run(self, users, buy_function, post_function):
+        """Покупка для всех пользователей; возвращает отчет о задержках"""
+        started = time.perf_counter()
+        futures = {
+            self.executor.submit(self._timed, buy_function, user, started): user
+            for user in users
+        }
+
+        latencies = []
+        completion_times = []
+        successful = 0
+
+        for future in as_completed(futures):
+            user = futures[future]
+            result, latency, since_start = future.result()
+            latencies.append(latency)
+            completion_times.append(since_start)
+
+            if result and result.get("success"):
+                successful += 1
+                self.post_executor.submit(self._post, post_function, user, result)
+
+        latencies.sort()
+        completion_times.sort()
+
+        report = {
+            "users": len(futures),
+            "successful": successful,
+            "latency_p50": self._percentile(latencies, 50),
+            "latency_p95": self._percentile(latencies, 95),
+            "latency_max": latencies[-1] if latencies else 0,
+            "first_completed": completion_times[0] if completion_times else 0,
+            "last_completed": completion_times[-1] if completion_times else 0
+        }
+
+        print(
+            f"Покупки: {report['successful']}/{report['users']} успешно, "
+            f"задержка p50 {report['latency_p50'] * 1000:.1f} мс, p95 {report['latency_p95'] * 1000:.1f} мс, "
+            f"последняя покупка завершена через {report['last_completed'] * 1000:.1f} мс от начала"
+        )
+
+        return report
+
+    def shutdown(self):
+        """Остановка пулов потоков"""
+        self.executor.shutdown(wait=False)
+        self.post_executor.shutdown(wait=True)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'BuyFanout'
+]
@@ -0,0 +1,157 @@
+# circuit_breaker.py - Автомат отключения недоступных API и отрицательный кэш токенов
+
+import threading
+import time
+from cachetools import LRUCache
+
+class CircuitBreaker:
+    """Автомат по внешнему API: после серии сбоев запросы не отправляются, затем пропускается пробный запрос"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, max_recovery_timeout=300, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.half_open_probes = half_open_probes
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.current_timeout = recovery_timeout
+        self.probes = 0
+        self.probe_started_at = 0
+
+        self.lock = threading.Lock()
+        self.stats = {
+            "opened": 0,
+            "rejected": 0
+        }
+
+    def allow(self):
+        """Можно ли отправить запрос (в полуоткрытом состоянии - только пробный)"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.current_timeout:
+                    self.stats["rejected"] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probes = 0
+
+            # Результат пробы так и не пришел (проверка отменена по дедлайну) - разрешаем новую
+            if time.monotonic() - self.probe_started_at > self.recovery_timeout:
+                self.probes = 0
+
+            if self.probes < self.half_open_probes:
+                self.probes += 1
+                self.probe_started_at = time.monotonic()
+                return True
+
+            self.stats["rejected"] += 1
+            return False
+
+    def retry_in(self):
+        """Время в секундах до следующего пробного запроса"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0, self.opened_at + self.current_timeout - time.monotonic())
+
+    def record_success(self):
+        """Успешный ответ: автомат замыкается"""
+        with self.lock:
+            if self.state != self.CLOSED:
+                print(f"API {self.name} снова доступно")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.current_timeout = self.recovery_timeout
+
+    def record_failure(self):
+        """Сбой API: после failure_threshold сбоев подряд или неудачной пробы автомат размыкается"""
+        with self.lock:
+            self.failures += 1
+
+            if self.state == self.HALF_OPEN:
+                # Проба не прошла: следующая пауза вдвое длиннее
+                self.current_timeout = min(self.max_recovery_timeout, self.current_timeout * 2)
+                self._open()
+            elif self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        """Размыкание автомата (вызывается под блокировкой)"""
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        print(f"API {self.name} недоступно, запросы приостановлены на {self.current_timeout:.0f} с")
+
+    def snapshot(self):
+        """Состояние автомата"""
+        with self.lock:
+            return dict(
+                self.stats,
+                name=self.name,
+                state=self.state,
+                failures=self.failures,
+                recovery_timeout=self.current_timeout
+            )
+
+class NegativeCache:
+    """Отрицательный кэш токенов: после каждого сбоя проверки интервал до следующей удваивается"""
+
+    def __init__(self, base_delay=10, max_delay=1800, max_size=100000):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # Адрес -> (число сбоев подряд, время, до которого проверка не выполняется)
+        self.entries = LRUCache(maxsize=max_size)
+        self.lock = threading.Lock()
+
+    def __contains__(self, token_address):
+        return self.blocked_for(token_address) > 0
+
+    def record_failure(self, token_address):
+        """Сбой проверки токена; возвращает задержку до следующей проверки"""
+        with self.lock:
+            failures, blocked_until = self.entries.get(token_address, (0, 0))
+            failures += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+            self.entries[token_address] = (failures, time.monotonic() + delay)
+            return delay
+
+    def record_success(self, token_address):
+        """Успешная проверка: токен удаляется из кэша"""
+        with self.lock:
+            self.entries.pop(token_address, None)
+
+    def failures(self, token_address):
+        """Число сбоев подряд"""
+        with self.lock:
+            return self.entries.get(token_address, (0, 0))[0]
+
+    def blocked_for(self, token_address):
+        """Время в секундах, в течение которого токен не проверяется"""
+        with self.lock:
+            entry = self.entries.get(token_address)
+        if entry is None:
+            return 0
+        return max(0, entry[1] - time.monotonic())
+
+    def stats(self):
+        """Размер кэша"""
+        with self.lock:
+            return {
+                "tokens": len(self.entries)
+            }
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'CircuitBreaker',
+    'NegativeCache'
+]
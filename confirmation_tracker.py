@@ -0,0 +1,185 @@
+# confirmation_tracker.py - Пакетное отслеживание подтверждения отправленных транзакций
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from base58 import b58decode
+from dotenv import load_dotenv
+
+from solana_service import rpc_request
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Максимум подписей в одном вызове getSignatureStatuses
+SIGNATURE_STATUSES_LIMIT = 256
+
+# Уровни подтверждения по возрастанию
+COMMITMENT_LEVELS = ["processed", "confirmed", "finalized"]
+
+def is_real_signature(signature):
+    """Подпись транзакции - 64 байта в base58 (симулированные подписи не отслеживаются)"""
+    try:
+        return len(b58decode(signature)) == 64
+    except (ValueError, TypeError):
+        return False
+
+class PendingSignature:
+    """Отправленная транзакция, ожидающая подтверждения"""
+
+    __slots__ = ("signature", "callback", "sent_at")
+
+    def __init__(self, signature, callback, sent_at):
+        self.signature = signature
+        self.callback = callback
+        self.sent_at = sent_at
+
+class ConfirmationTracker:
+    """Подписи всех пользователей опрашиваются одним вызовом getSignatureStatuses на пакет до 256 штук"""
+
+    def __init__(self, poll_interval=0.5, timeout=90, commitment="confirmed", callback_workers=4):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.commitment_level = COMMITMENT_LEVELS.index(commitment)
+
+        # Ожидающие подписи: подпись -> PendingSignature
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        # Обработчики результатов (запись в БД, уведомления) выполняются вне потока опроса
+        self.callback_workers = callback_workers
+        self.executor = None
+
+        self.thread = None
+        self.stopped = threading.Event()
+
+        self.stats = {
+            "tracked": 0,
+            "confirmed": 0,
+            "failed": 0,
+            "expired": 0,
+            "rpc_calls": 0,
+            "confirm_time_total": 0.0
+        }
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+    def track(self, signature, callback):
+        """Отслеживание подписи; callback(signature, status, time_to_confirm, error) вызывается один раз.
+        Возвращает False для симулированных подписей"""
+        if not signature or not is_real_signature(signature):
+            return False
+
+        with self.lock:
+            self.pending[signature] = PendingSignature(signature, callback, time.monotonic())
+            self.stats["tracked"] += 1
+
+        self._ensure_thread()
+        return True
+
+    def _ensure_thread(self):
+        """Запуск потока опроса при первом использовании"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.callback_workers, thread_name_prefix="confirmation")
+                if self.thread is None or not self.thread.is_alive():
+                    self.stopped.clear()
+                    self.thread = threading.Thread(target=self._run, name="confirmation-tracker")
+                    self.thread.daemon = True
+                    self.thread.start()
+
+    def _run(self):
+        """Периодический опрос статусов всех ожидающих подписей"""
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Ошибка при проверке подтверждения транзакций: {str(e)}")
+
+    def poll(self):
+        """Один проход: статусы всех ожидающих подписей пакетами по SIGNATURE_STATUSES_LIMIT"""
+        with self.lock:
+            signatures = list(self.pending)
+
+        for start in range(0, len(signatures), SIGNATURE_STATUSES_LIMIT):
+            chunk = signatures[start:start + SIGNATURE_STATUSES_LIMIT]
+            result = rpc_request("getSignatureStatuses", [chunk, {"searchTransactionHistory": False}])
+
+            with self.lock:
+                self.stats["rpc_calls"] += 1
+
+            now = time.monotonic()
+            for signature, status in zip(chunk, result["value"]):
+                self._update(signature, status, now)
+
+    def _update(self, signature, status, now):
+        """Применение статуса одной подписи"""
+        with self.lock:
+            pending = self.pending.get(signature)
+        if pending is None:
+            return
+
+        elapsed = now - pending.sent_at
+
+        if status is None:
+            # Транзакция не найдена: блокхеш истек или транзакция потеряна
+            if elapsed > self.timeout:
+                self._finish(pending, "expired", elapsed, "Транзакция не подтверждена за отведенное время")
+            return
+
+        if status.get("err"):
+            self._finish(pending, "failed", elapsed, str(status["err"]))
+            return
+
+        confirmation = status.get("confirmationStatus") or "processed"
+        if COMMITMENT_LEVELS.index(confirmation) >= self.commitment_level:
+            self._finish(pending, "confirmed", elapsed, None)
+
+    def _finish(self, pending, status, elapsed, error):
+        """Снятие подписи с отслеживания и вызов обработчика"""
+        with self.lock:
+            if self.pending.pop(pending.signature, None) is None:
+                return
+            self.stats[status] += 1
+            if status == "confirmed":
+                self.stats["confirm_time_total"] += elapsed
+
+        self.executor.submit(self._callback, pending, status, elapsed, error)
+
+    @staticmethod
+    def _callback(pending, status, elapsed, error):
+        """Вызов обработчика с перехватом ошибок"""
+        try:
+            pending.callback(pending.signature, status, elapsed, error)
+        except Exception as e:
+            print(f"Ошибка при обработке подтверждения транзакции {pending.signature}: {str(e)}")
+
+    def stop(self):
+        """Остановка опроса"""
+        self.stopped.set()
+
+    def get_stats(self):
+        """Счетчики и среднее время подтверждения"""
+        with self.lock:
+            stats = dict(self.stats, pending=len(self.pending))
+        stats["avg_confirm_time"] = stats["confirm_time_total"] / stats["confirmed"] if stats["confirmed"] else 0
+        return stats
+
+# Общий трекер подтверждений для всего процесса
+confirmation_tracker = ConfirmationTracker(
+    float(os.environ.get("CONFIRMATION_POLL_INTERVAL", 0.5)),
+    float(os.environ.get("CONFIRMATION_TIMEOUT", 90)),
+    os.environ.get("CONFIRMATION_COMMITMENT", "confirmed")
+)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'ConfirmationTracker',
+    'PendingSignature',
+    'is_real_signature',
+    'confirmation_tracker'
+]
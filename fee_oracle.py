@@ -0,0 +1,128 @@
+# fee_oracle.py - Оценка приоритетной комиссии по недавним слотам
+
+import threading
+import time
+
+class FeeOracle:
+    """Фоновая выборка getRecentPrioritizationFees и перцентили по скользящему окну слотов"""
+
+    def __init__(self, rpc_function, refresh_interval=5, window_slots=300, percentile=75,
+                 min_price=0, max_price=1000000, accounts=None, fallback_price=10000):
+        self.rpc_function = rpc_function
+        self.refresh_interval = refresh_interval
+        self.window_slots = window_slots
+        self.percentile = percentile
+        self.min_price = min_price
+        self.max_price = max_price
+
+        # Цена, пока не получено ни одной выборки (нулевая комиссия в первой волне покупок недопустима)
+        self.fallback_price = fallback_price
+
+        # Аккаунты, за запись в которые конкурируют транзакции (пусто - комиссии по всей сети)
+        self.accounts = accounts or []
+
+        # Комиссии по слотам (микролампорты за вычислительную единицу) и отсортированная копия для перцентилей
+        self.fees_by_slot = {}
+        self.sorted_fees = []
+
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.updated_at = 0
+
+        self.stats = {
+            "refreshes": 0,
+            "errors": 0
+        }
+
+    def refresh(self):
+        """Запрос комиссий последних слотов и обновление окна"""
+        samples = self.rpc_function("getRecentPrioritizationFees", [self.accounts] if self.accounts else [])
+
+        with self.lock:
+            for sample in samples:
+                self.fees_by_slot[sample["slot"]] = sample["prioritizationFee"]
+
+            # Оставляем только последние window_slots слотов
+            if len(self.fees_by_slot) > self.window_slots:
+                for slot in sorted(self.fees_by_slot)[:len(self.fees_by_slot) - self.window_slots]:
+                    del self.fees_by_slot[slot]
+
+            self.sorted_fees = sorted(self.fees_by_slot.values())
+            self.updated_at = time.monotonic()
+            self.stats["refreshes"] += 1
+
+    def get_price(self, percentile=None):
+        """Цена вычислительной единицы в микролампортах по перцентилю окна (без запроса к RPC)"""
+        self._ensure_thread()
+
+        percentile = self.percentile if percentile is None else percentile
+        with self.lock:
+            fees = self.sorted_fees
+            if not fees:
+                return int(min(self.max_price, max(self.min_price, self.fallback_price)))
+            index = min(len(fees) - 1, int(round(percentile / 100 * (len(fees) - 1))))
+            price = fees[index]
+
+        return int(min(self.max_price, max(self.min_price, price)))
+
+    def start(self):
+        """Синхронная первая выборка и запуск фонового обновления (вызывается при старте процесса)"""
+        try:
+            self.refresh()
+        except Exception as e:
+            with self.lock:
+                self.stats["errors"] += 1
+            print(f"Ошибка при получении приоритетных комиссий: {str(e)}")
+
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        """Запуск фоновой выборки при первом использовании"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.stopped.clear()
+                    self.thread = threading.Thread(target=self._run, name="fee-oracle")
+                    self.thread.daemon = True
+                    self.thread.start()
+
+    def _run(self):
+        """Периодическое обновление окна комиссий"""
+        # Свежая выборка, сделанная в start, не повторяется сразу же
+        if self.updated_at:
+            self.stopped.wait(self.refresh_interval)
+
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                print(f"Ошибка при получении приоритетных комиссий: {str(e)}")
+
+            self.stopped.wait(self.refresh_interval)
+
+    def stop(self):
+        """Остановка фоновой выборки"""
+        self.stopped.set()
+
+    def snapshot(self):
+        """Размер окна, перцентили и счетчики"""
+        with self.lock:
+            fees = self.sorted_fees
+            percentiles = {
+                f"p{percent}": fees[min(len(fees) - 1, int(round(percent / 100 * (len(fees) - 1))))]
+                for percent in (50, 75, 90, 99)
+            } if fees else {}
+            return dict(
+                self.stats,
+                slots=len(fees),
+                age=time.monotonic() - self.updated_at if self.updated_at else None,
+                **percentiles
+            )
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'FeeOracle'
+]
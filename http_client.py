@@ -0,0 +1,159 @@
+# http_client.py - Общий HTTP-клиент для запросов к внешним API
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from rate_limiter import rate_limiter, DeadlineExceeded
+
+# httpx с пакетом h2 необязателен: с ним запросы идут по HTTP/2
+try:
+    import httpx
+    import h2
+except ImportError:
+    httpx = None
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Дедлайн текущей задачи (значение time.monotonic()); None - без ограничения
+request_deadline = ContextVar("request_deadline", default=None)
+
+@contextmanager
+def deadline_scope(deadline):
+    """Ограничение всех запросов внутри блока дедлайном (значение time.monotonic())"""
+    token = request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def remaining_budget():
+    """Оставшееся время до дедлайна в секундах (None, если дедлайн не задан)"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def is_upstream_error(error):
+    """Ошибка соединения или таймаут внешнего API (а не исчерпанный бюджет или лимит на нашей стороне)"""
+    if isinstance(error, requests.RequestException):
+        return True
+    return httpx is not None and isinstance(error, httpx.HTTPError)
+
+def is_local_timeout(error):
+    """Таймаут на нашей стороне: исчерпан бюджет цикла или не дождались лимита запросов (API тут ни при чем)"""
+    return isinstance(error, TimeoutError) and not is_upstream_error(error)
+
+def is_upstream_status(status_code):
+    """Код ответа, означающий сбой или перегрузку внешнего API"""
+    return status_code == 429 or status_code >= 500
+
+class HttpClient:
+    """Пул keep-alive соединений на каждый хост, таймауты соединения и чтения, учет дедлайна цикла"""
+
+    def __init__(self, connect_timeout=3, read_timeout=10, pool_size=32, http2=False):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.http2 = http2 and httpx is not None
+
+        if http2 and httpx is None:
+            print("HTTP/2 недоступен (нужен пакет httpx[http2]), используются соединения HTTP/1.1")
+
+        # Сессии по хостам: схема://хост -> requests.Session или httpx.Client
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, url):
+        """Сессия хоста URL (создается при первом обращении)"""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+
+        session = self.sessions.get(origin)
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(origin)
+                if session is None:
+                    session = self.sessions[origin] = self._create_session()
+        return session
+
+    def _create_session(self):
+        """Новая сессия с пулом соединений на pool_size потоков"""
+        if self.http2:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            return httpx.Client(http2=True, limits=limits)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def timeout(self, read_timeout=None):
+        """Таймауты запроса с учетом оставшегося бюджета цикла"""
+        connect_timeout = self.connect_timeout
+        read_timeout = self.read_timeout if read_timeout is None else read_timeout
+
+        budget = remaining_budget()
+        if budget is not None:
+            if budget <= 0:
+                raise DeadlineExceeded("Бюджет времени цикла исчерпан")
+            connect_timeout = min(connect_timeout, budget)
+            read_timeout = min(read_timeout, budget)
+
+        if self.http2:
+            return httpx.Timeout(read_timeout, connect=connect_timeout)
+        return (connect_timeout, read_timeout)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """Запрос через пул соединений хоста и общий ограничитель частоты (timeout - таймаут чтения)"""
+        # Таймауты пересчитываются перед каждой попыткой: повторы после 429/5xx укладываются в бюджет цикла
+        return rate_limiter.request(
+            method,
+            url,
+            session=self.session(url),
+            budget=remaining_budget,
+            timeout_function=lambda: self.timeout(timeout),
+            **kwargs
+        )
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """Закрытие всех соединений"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+# Общий HTTP-клиент процесса
+http_client = HttpClient(
+    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3)),
+    float(os.environ.get("HTTP_READ_TIMEOUT", 10)),
+    int(os.environ.get("HTTP_POOL_SIZE", 32)),
+    os.environ.get("HTTP2_ENABLED", "false").lower() == "true"
+)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'DeadlineExceeded',
+    'HttpClient',
+    'is_upstream_error',
+    'is_local_timeout',
+    'is_upstream_status',
+    'deadline_scope',
+    'remaining_budget',
+    'request_deadline',
+    'http_client'
+]
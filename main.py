@@ -11,6 +11,7 @@ load_dotenv()
 
 # Импорт модулей приложения
 from app import app
+import models
 import telegram_service
 import token_monitor
 
@@ -29,6 +30,11 @@ if __name__ == "__main__":
     # Получаем порт из переменных окружения или используем 5000 по умолчанию
     port = int(os.environ.get("PORT", 5000))
     
+    # Создаем индексы и проверяем, что запросы горячего пути их используют
+    models.ensure_indexes()
+    models.check_query_plans()
+    print("Индексы БД проверены.")
+    
     # Запускаем мониторинг токенов в отдельном потоке
     token_monitor.start_monitoring()
     print("Мониторинг токенов запущен.")
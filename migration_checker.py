@@ -0,0 +1,99 @@
+# migration_checker.py - Конкурентная проверка миграции токенов
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+from http_client import deadline_scope, is_upstream_error, is_local_timeout
+
+class MigrationChecker:
+    """Ограниченный пул потоков для одновременной проверки миграции токенов"""
+
+    def __init__(self, check_function, max_workers=32, cycle_deadline=10):
+        self.check_function = check_function
+        self.max_workers = max_workers
+        self.cycle_deadline = cycle_deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="migration-check")
+
+        # Адреса, проверка которых еще выполняется (не отправляем их повторно)
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+        # Статистика последнего цикла
+        self.last_cycle_stats = {
+            "submitted": 0,
+            "completed": 0,
+            "timed_out": 0,
+            "duration": 0
+        }
+
+    def _release(self, token_address):
+        """Снятие отметки о выполняющейся проверке"""
+        with self.lock:
+            self.in_flight.discard(token_address)
+
+    def _check(self, deadline, token_address, platform):
+        """Проверка одного токена; HTTP-запросы внутри ограничены дедлайном цикла"""
+        with deadline_scope(deadline):
+            return self.check_function(token_address, platform)
+
+    def check_all(self, tokens):
+        """Проверка токенов (пары адрес/платформа), результаты отдаются по мере готовности до дедлайна цикла"""
+        started = time.monotonic()
+        deadline = started + self.cycle_deadline
+        futures = {}
+
+        for token_address, platform in tokens:
+            with self.lock:
+                if token_address in self.in_flight:
+                    continue
+                self.in_flight.add(token_address)
+
+            future = self.executor.submit(self._check, deadline, token_address, platform)
+            future.add_done_callback(lambda f, address=token_address: self._release(address))
+            futures[future] = token_address
+
+        completed = 0
+        timed_out = 0
+
+        try:
+            for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+                token_address = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Ошибка при проверке миграции токена {token_address}: {str(e)}")
+                    result = {
+                        "success": False,
+                        "migration_percentage": 0,
+                        "above_threshold": False,
+                        "upstream_error": is_upstream_error(e),
+                        "local_timeout": is_local_timeout(e),
+                        "error": str(e)
+                    }
+
+                completed += 1
+                yield token_address, result
+        except FuturesTimeoutError:
+            # Отменяем еще не начатые проверки, начатые завершатся в фоне
+            pending = [f for f in futures if not f.done()]
+            for future in pending:
+                future.cancel()
+            timed_out = len(pending)
+            print(f"Дедлайн цикла проверки истек: не завершено {timed_out} из {len(futures)} проверок")
+        finally:
+            self.last_cycle_stats = {
+                "submitted": len(futures),
+                "completed": completed,
+                "timed_out": timed_out,
+                "duration": time.monotonic() - started
+            }
+
+    def shutdown(self):
+        """Остановка пула потоков"""
+        self.executor.shutdown(wait=False)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'MigrationChecker'
+]
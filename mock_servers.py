@@ -0,0 +1,288 @@
+# mock_servers.py - Локальные заглушки внешних сервисов для проверки без доступа к сети
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from base58 import b58encode
+
+class FeedServer:
+    """Заглушка ленты новых токенов: SSE-поток /tokens/stream и список /tokens/new"""
+
+    def __init__(self, host="127.0.0.1", port=8081, interval=1.0, platform="pump.fun"):
+        self.interval = interval
+        self.platform = platform
+
+        # Журнал событий (id, токен) для продолжения потока по Last-Event-ID
+        self.events = []
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/tokens/stream"):
+                    feed._handle_stream(self)
+                elif self.path.startswith("/tokens/new"):
+                    feed._handle_list(self)
+                else:
+                    self.send_error(404)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def publish(self, token=None):
+        """Добавление нового токена в ленту"""
+        if token is None:
+            suffix = uuid.uuid4().hex[:8]
+            token = {
+                "address": uuid.uuid4().hex + uuid.uuid4().hex[:12],
+                "name": f"Mock Token {suffix}",
+                "symbol": suffix[:4].upper()
+            }
+
+        with self.condition:
+            self.events.append((len(self.events) + 1, token))
+            self.condition.notify_all()
+
+        return token
+
+    def _handle_list(self, handler):
+        """Последние токены одним JSON-списком (как /tokens/new)"""
+        with self.condition:
+            tokens = [token for event_id, token in self.events[-50:]]
+
+        body = json.dumps(tokens).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _handle_stream(self, handler):
+        """SSE-поток: сначала пропущенные события после Last-Event-ID, затем новые"""
+        last_event_id = handler.headers.get("Last-Event-ID")
+        position = int(last_event_id) if last_event_id and last_event_id.isdigit() else len(self.events)
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+
+        try:
+            handler.wfile.write(b"retry: 1000\n\n")
+            handler.wfile.flush()
+
+            while not self.stopped.is_set():
+                with self.condition:
+                    if position >= len(self.events):
+                        self.condition.wait(timeout=15)
+                    pending = self.events[position:]
+
+                if not pending:
+                    # Keep-alive комментарий
+                    handler.wfile.write(b": ping\n\n")
+                else:
+                    for event_id, token in pending:
+                        handler.wfile.write(f"id: {event_id}\ndata: {json.dumps(token)}\n\n".encode("utf-8"))
+                    position = pending[-1][0]
+
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _generate(self):
+        """Периодическая публикация случайных токенов"""
+        while not self.stopped.wait(self.interval):
+            self.publish()
+
+    def start(self):
+        """Запуск сервера (и генератора токенов, если задан интервал) в фоновых потоках"""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.interval:
+            threading.Thread(target=self._generate, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+class RpcServer:
+    """Заглушка JSON-RPC ноды Solana с настраиваемой задержкой и долей ошибок"""
+
+    def __init__(self, host="127.0.0.1", port=8899, latency=0.02, jitter=0.0, error_rate=0.0,
+                 confirm_delay=1.0, failed_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.started = time.monotonic()
+
+        # Отправленные транзакции: подпись -> (время отправки, завершится ли ошибкой)
+        self.confirm_delay = confirm_delay
+        self.failed_rate = failed_rate
+        self.transactions = {}
+
+        # Счетчик запросов по методам
+        self.calls = {}
+        self.lock = threading.Lock()
+
+        rpc = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                rpc._handle(self)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def block_height(self):
+        """Высота блока растет на один каждые 0.4 секунды"""
+        return int((time.monotonic() - self.started) / 0.4)
+
+    def _result(self, method, params):
+        """Ответ на один вызов (None - метод не поддерживается)"""
+        height = self.block_height()
+
+        if method == "getLatestBlockhash":
+            return {
+                "context": {"slot": height},
+                "value": {"blockhash": "4uQeVj5tqViQh7yWWGStvkEG1Zmhx6uasJtWCJziofM", "lastValidBlockHeight": height + 150}
+            }
+        if method == "getBlockHeight":
+            return height
+        if method == "getBalance":
+            return {"context": {"slot": height}, "value": 1000000000}
+        if method == "getMultipleAccounts":
+            return {
+                "context": {"slot": height},
+                "value": [
+                    {"lamports": 1000000000, "data": ["", "base64"], "owner": "11111111111111111111111111111111",
+                     "executable": False, "rentEpoch": 0}
+                    for address in params[0]
+                ]
+            }
+        if method == "sendTransaction":
+            signature = b58encode(os.urandom(64)).decode("ascii")
+            with self.lock:
+                self.transactions[signature] = (time.monotonic(), random.random() < self.failed_rate)
+            return signature
+        if method == "getRecentPrioritizationFees":
+            # Последние 150 слотов: в большинстве комиссия нулевая, в остальных - с тяжелым хвостом
+            return [
+                {"slot": height - i, "prioritizationFee": 0 if random.random() < 0.4 else int(random.paretovariate(1.5) * 1000)}
+                for i in range(150)
+            ]
+        if method == "getSignatureStatuses":
+            return {"context": {"slot": height}, "value": [self._signature_status(signature) for signature in params[0]]}
+        return None
+
+    def _signature_status(self, signature):
+        """Статус транзакции: через confirm_delay после отправки она подтверждена или завершилась ошибкой"""
+        with self.lock:
+            transaction = self.transactions.get(signature)
+        if transaction is None:
+            return None
+
+        sent_at, failed = transaction
+        age = time.monotonic() - sent_at
+        if age < self.confirm_delay / 2:
+            return None
+        if age < self.confirm_delay:
+            return {"slot": self.block_height(), "confirmations": 0, "err": None, "confirmationStatus": "processed"}
+        return {
+            "slot": self.block_height(),
+            "confirmations": 1,
+            "err": {"InstructionError": [0, "Custom"]} if failed else None,
+            "confirmationStatus": "confirmed"
+        }
+
+    def _handle(self, handler):
+        """Обработка JSON-RPC запроса (одиночного или пакета)"""
+        request = json.loads(handler.rfile.read(int(handler.headers["Content-Length"])))
+
+        time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if random.random() < self.error_rate:
+            handler.send_error(503)
+            return
+
+        def respond(call):
+            with self.lock:
+                self.calls[call["method"]] = self.calls.get(call["method"], 0) + 1
+
+            result = self._result(call["method"], call.get("params") or [])
+            if result is None:
+                return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32601, "message": "Method not found"}}
+            return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+
+        response = [respond(call) for call in request] if isinstance(request, list) else respond(request)
+
+        body = json.dumps(response).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.server.shutdown()
+        self.server.server_close()
+
+# Запуск заглушек из командной строки
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальные заглушки внешних сервисов")
+    subparsers = parser.add_subparsers(dest="server", required=True)
+
+    feed_parser = subparsers.add_parser("feed", help="Лента новых токенов (SSE)")
+    feed_parser.add_argument("--host", default="127.0.0.1")
+    feed_parser.add_argument("--port", type=int, default=8081)
+    feed_parser.add_argument("--interval", type=float, default=1.0, help="Интервал публикации токенов в секундах")
+
+    rpc_parser = subparsers.add_parser("rpc", help="JSON-RPC нода Solana")
+    rpc_parser.add_argument("--host", default="127.0.0.1")
+    rpc_parser.add_argument("--port", type=int, default=8899)
+    rpc_parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа в секундах")
+    rpc_parser.add_argument("--jitter", type=float, default=0.0, help="Разброс задержки в секундах")
+    rpc_parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 503")
+    rpc_parser.add_argument("--confirm-delay", type=float, default=1.0, help="Время подтверждения транзакции в секундах")
+    rpc_parser.add_argument("--failed-rate", type=float, default=0.0, help="Доля транзакций, завершающихся ошибкой")
+
+    args = parser.parse_args()
+
+    if args.server == "feed":
+        server = FeedServer(args.host, args.port, args.interval).start()
+        print(f"Лента токенов: {server.url}/tokens/stream (SSE), {server.url}/tokens/new")
+    elif args.server == "rpc":
+        server = RpcServer(
+            args.host, args.port, args.latency, args.jitter, args.error_rate, args.confirm_delay, args.failed_rate
+        ).start()
+        print(f"RPC нода: {server.url}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,16 +1,73 @@
 # models.py - Модели данных для проекта
 
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+from cachetools import LRUCache
+import atexit
+import threading
 import os
 from dotenv import load_dotenv
 
+from storage import storage
+
 # Загрузка переменных окружения
 load_dotenv()
 
-# Подключение к MongoDB
-client = MongoClient(os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"))
-db = client["solana_bot_db"]
+# Хранилище данных (MongoDB или in-memory, см. STORAGE_BACKEND); подключение к MongoDB - при первом запросе
+db = storage
+
+# Поддержание документа статистики пользователя при каждой покупке и продаже (/stats - одно чтение по _id)
+USER_STATS_SUMMARY = os.environ.get("USER_STATS_SUMMARY", "false").lower() == "true"
+
+# Максимальный размер страницы при постраничной выборке
+PAGE_SIZE_LIMIT = int(os.environ.get("PAGE_SIZE_LIMIT", 500))
+
+# История процентов миграции: срок хранения наблюдений, интервал свертки и срок хранения свернутых данных (в секундах)
+MIGRATION_HISTORY_ENABLED = os.environ.get("MIGRATION_HISTORY_ENABLED", "true").lower() == "true"
+MIGRATION_HISTORY_RETENTION = int(os.environ.get("MIGRATION_HISTORY_RETENTION", 86400))
+MIGRATION_HISTORY_BUCKET = int(os.environ.get("MIGRATION_HISTORY_BUCKET", 60))
+MIGRATION_HISTORY_DOWNSAMPLED_RETENTION = int(os.environ.get("MIGRATION_HISTORY_DOWNSAMPLED_RETENTION", 30 * 86400))
+MIGRATION_HISTORY_DOWNSAMPLE_INTERVAL = int(os.environ.get("MIGRATION_HISTORY_DOWNSAMPLE_INTERVAL", 300))
+
+def encode_cursor(document, field="_id"):
+    """Курсор следующей страницы по последнему документу текущей"""
+    if field == "_id":
+        return str(document["_id"])
+    return f"{document[field].isoformat()}_{document['_id']}"
+
+def decode_cursor(cursor, field="_id"):
+    """Разбор курсора в пару (значение поля сортировки, _id); при неверном курсоре - ValueError"""
+    try:
+        if field == "_id":
+            return None, ObjectId(cursor)
+        value, _, document_id = cursor.rpartition("_")
+        return datetime.fromisoformat(value), ObjectId(document_id)
+    except (TypeError, ValueError, InvalidId) as e:
+        raise ValueError(f"Неверный курсор страницы: {cursor}") from e
+
+def keyset_find(collection, query, field="_id", direction=ASCENDING, after=None, limit=None, projection=None):
+    """Курсор MongoDB по ключу (field, _id) начиная после курсора after.
+    В отличие от skip, каждая страница - поиск по индексу, независимо от ее номера"""
+    if after is not None:
+        value, last_id = decode_cursor(after, field)
+        operator = "$gt" if direction == ASCENDING else "$lt"
+        if field == "_id":
+            position = {"_id": {operator: last_id}}
+        else:
+            position = {"$or": [{field: {operator: value}}, {field: value, "_id": {operator: last_id}}]}
+        query = {"$and": [query, position]} if query else position
+    
+    # Поле сортировки нужно для курсора следующей страницы
+    if projection and field != "_id" and any(projection.values()):
+        projection = {**projection, field: 1}
+    
+    sort = [("_id", direction)] if field == "_id" else [(field, direction), ("_id", direction)]
+    cursor = collection.find(query, projection).sort(sort)
+    if limit:
+        cursor = cursor.limit(min(limit, PAGE_SIZE_LIMIT))
+    return cursor
 
 class User:
     """Модель пользователя"""
@@ -30,7 +87,8 @@ class User:
             "telegram_chat_id": telegram_chat_id,
             "language": language,
             "active": active,
-            "created_at": datetime.now()
+            "created_at": datetime.now(),
+            "updated_at": datetime.now()
         }
         
         result = User.collection.insert_one(user_data)
@@ -59,17 +117,17 @@ class User:
     @staticmethod
     def update(user_id, data):
         """Обновление данных пользователя"""
-        User.collection.update_one({"_id": user_id}, {"$set": data})
+        User.collection.update_one({"_id": user_id}, {"$set": {**data, "updated_at": datetime.now()}})
     
     @staticmethod
     def deactivate(user_id):
         """Деактивация пользователя"""
-        User.collection.update_one({"_id": user_id}, {"$set": {"active": False}})
+        User.collection.update_one({"_id": user_id}, {"$set": {"active": False, "updated_at": datetime.now()}})
     
     @staticmethod
     def activate(user_id):
         """Активация пользователя"""
-        User.collection.update_one({"_id": user_id}, {"$set": {"active": True}})
+        User.collection.update_one({"_id": user_id}, {"$set": {"active": True, "updated_at": datetime.now()}})
 
 class Token:
     """Модель токена"""
@@ -93,6 +151,36 @@ class Token:
         result = Token.collection.insert_one(token_data)
         return result.inserted_id
     
+    @staticmethod
+    def bulk_create_missing(tokens, platform, status="tracking"):
+        """Пакетное добавление токенов, которых еще нет в БД (один неупорядоченный bulk_write)"""
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                {"address": token["address"]},
+                {
+                    "$setOnInsert": {
+                        "address": token["address"],
+                        "name": token["name"],
+                        "symbol": token["symbol"],
+                        "platform": platform,
+                        "last_migration_percentage": 0,
+                        "status": status,
+                        "time_added": now,
+                        "last_updated": now
+                    }
+                },
+                upsert=True
+            )
+            for token in tokens
+        ]
+        
+        if not operations:
+            return 0
+        
+        result = Token.collection.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    
     @staticmethod
     def find_by_address(address):
         """Поиск токена по адресу"""
@@ -100,22 +188,41 @@ class Token:
     
     @staticmethod
     def update_migration_percentage(address, percentage):
-        """Обновление процента миграции токена"""
+        """Обновление процента миграции токена (через буфер отложенной записи)"""
+        migration_write_buffer.add(address, percentage)
+    
+    @staticmethod
+    def flush_migration_updates():
+        """Немедленная запись накопленных процентов миграции"""
+        return migration_write_buffer.flush()
+    
+    @staticmethod
+    def get_migration_trajectory(address, since=None, until=None):
+        """Траектория процента миграции токена: список (время, процент) по возрастанию времени"""
+        if migration_history is None:
+            return []
+        return migration_history.get_trajectory(address, since, until)
+    
+    @staticmethod
+    def update_status(address, status):
+        """Обновление статуса токена"""
         Token.collection.update_one(
             {"address": address},
             {
                 "$set": {
-                    "last_migration_percentage": percentage,
+                    "status": status,
                     "last_updated": datetime.now()
                 }
             }
         )
     
     @staticmethod
-    def update_status(address, status):
-        """Обновление статуса токена"""
-        Token.collection.update_one(
-            {"address": address},
+    def bulk_update_status(addresses, status):
+        """Обновление статуса нескольких токенов одним запросом"""
+        if not addresses:
+            return 0
+        result = Token.collection.update_many(
+            {"address": {"$in": list(addresses)}},
             {
                 "$set": {
                     "status": status,
@@ -123,16 +230,324 @@ class Token:
                 }
             }
         )
+        return result.modified_count
     
     @staticmethod
-    def get_tracking_tokens():
-        """Получение всех отслеживаемых токенов"""
-        return list(Token.collection.find({"status": "tracking"}))
+    def get_finished_statuses(addresses):
+        """Статусы токенов из списка, которые уже не отслеживаются (куплены, истекли и т.д.): адрес -> статус"""
+        cursor = Token.collection.find(
+            {"address": {"$in": list(addresses)}, "status": {"$ne": "tracking"}},
+            {"_id": 0, "address": 1, "status": 1}
+        )
+        return {token["address"]: token["status"] for token in cursor}
     
     @staticmethod
-    def get_all():
-        """Получение всех токенов"""
-        return list(Token.collection.find())
+    def get_tracking_tokens(limit=None, after=None, projection=None, stream=False):
+        """Получение отслеживаемых токенов (страница после курсора after, если задан limit).
+        При stream=True возвращается курсор: документы читаются из БД по мере обхода"""
+        cursor = keyset_find(Token.collection, {"status": "tracking"}, after=after, limit=limit, projection=projection)
+        return cursor if stream else list(cursor)
+    
+    @staticmethod
+    def get_all(limit=None, after=None, projection=None, stream=False):
+        """Получение токенов (страница после курсора after, если задан limit; при stream=True - курсор)"""
+        cursor = keyset_find(Token.collection, {}, after=after, limit=limit, projection=projection)
+        return cursor if stream else list(cursor)
+
+class MigrationWriteBuffer:
+    """Отложенная запись процентов миграции: последнее значение на адрес, запись одним bulk_write"""
+    
+    def __init__(self, get_collection, flush_interval=1.0, max_pending=500, max_remembered=100000,
+                 history=None, max_samples=100000):
+        self.get_collection = get_collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        
+        # Ожидающие записи: адрес -> (процент, время наблюдения)
+        self.pending = {}
+        
+        # История процентов: каждое наблюдение (адрес, процент, время) записывается, даже если процент не изменился,
+        # иначе для застывшего токена в окне не будет точек и скорость роста не определится
+        self.history = history
+        self.max_samples = max_samples
+        self.samples = []
+        
+        # Последние записанные значения (неизменившийся процент не записываем повторно)
+        self.last_written = LRUCache(maxsize=max_remembered)
+        
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        
+        self.stats = {
+            "received": 0,
+            "skipped_unchanged": 0,
+            "coalesced": 0,
+            "written": 0,
+            "flushes": 0,
+            "errors": 0,
+            "samples_written": 0,
+            "samples_dropped": 0
+        }
+    
+    def add(self, address, percentage):
+        """Постановка процента миграции в очередь записи"""
+        with self.lock:
+            self.stats["received"] += 1
+            observed_at = datetime.now()
+            
+            # История пополняется независимо от того, нужно ли обновлять документ токена
+            if self.history is not None:
+                self.samples.append((address, percentage, observed_at))
+            
+            if address not in self.pending and self.last_written.get(address) == percentage:
+                self.stats["skipped_unchanged"] += 1
+            else:
+                if address in self.pending:
+                    self.stats["coalesced"] += 1
+                self.pending[address] = (percentage, observed_at)
+            pending_count = len(self.pending)
+        
+        # Поток нужен и для записи наблюдений неизменившихся процентов
+        self._ensure_thread()
+        
+        # Досрочная запись при накоплении большого пакета
+        if pending_count >= self.max_pending:
+            self.wakeup.set()
+    
+    def flush(self):
+        """Запись всех ожидающих значений одним bulk_write"""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                
+                # Записываемые значения считаются записанными уже сейчас: add того же значения во время записи
+                # пропускается, а любое другое ставится в очередь (при ошибке прежние значения восстанавливаются)
+                previous = {address: self.last_written.get(address) for address in pending}
+                for address, (percentage, observed_at) in pending.items():
+                    self.last_written[address] = percentage
+            
+            if self.history is not None:
+                self._flush_samples()
+            
+            if not pending:
+                return 0
+            
+            operations = [
+                UpdateOne(
+                    {"address": address},
+                    {
+                        "$set": {
+                            "last_migration_percentage": percentage,
+                            "last_updated": observed_at
+                        }
+                    }
+                )
+                for address, (percentage, observed_at) in pending.items()
+            ]
+            
+            try:
+                self.get_collection().bulk_write(operations, ordered=False)
+            except Exception as e:
+                print(f"Ошибка при записи процентов миграции: {str(e)}")
+                
+                # Возвращаем неудавшиеся записи в очередь, не затирая более новые значения
+                with self.lock:
+                    self.stats["errors"] += 1
+                    for address, value in pending.items():
+                        if previous[address] is None:
+                            self.last_written.pop(address, None)
+                        else:
+                            self.last_written[address] = previous[address]
+                        self.pending.setdefault(address, value)
+                return 0
+            
+            with self.lock:
+                self.stats["written"] += len(operations)
+                self.stats["flushes"] += 1
+            
+            return len(operations)
+    
+    def _flush_samples(self):
+        """Запись накопленных наблюдений в историю (вызывается под flush_lock)"""
+        with self.lock:
+            samples, self.samples = self.samples, []
+        
+        if not samples:
+            return
+        
+        try:
+            self.history.write(samples)
+        except Exception as e:
+            print(f"Ошибка при записи истории процентов миграции: {str(e)}")
+            
+            # Возвращаем наблюдения в начало очереди; при долгой недоступности БД отбрасываем самые старые
+            with self.lock:
+                self.stats["errors"] += 1
+                self.samples[:0] = samples
+                overflow = len(self.samples) - self.max_samples
+                if overflow > 0:
+                    del self.samples[:overflow]
+                    self.stats["samples_dropped"] += overflow
+            return
+        
+        with self.lock:
+            self.stats["samples_written"] += len(samples)
+    
+    def _ensure_thread(self):
+        """Запуск фонового потока записи при первом использовании"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self._run, name="migration-write-buffer")
+                    self.thread.daemon = True
+                    self.thread.start()
+    
+    def _run(self):
+        """Периодическая запись буфера"""
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+class MigrationHistory:
+    """История процентов миграции: наблюдения в time-series коллекции с ограниченным сроком хранения
+    и их свертка по интервалам (первое, последнее, минимум, максимум) с более долгим сроком хранения"""
+    
+    def __init__(self, database, retention=86400, bucket=60, downsampled_retention=30 * 86400, downsample_interval=300):
+        self.database = database
+        self.collection = database["migration_history"]
+        self.downsampled_collection = database["migration_history_downsampled"]
+        self.retention = retention
+        self.bucket = bucket
+        self.downsampled_retention = downsampled_retention
+        self.downsample_interval = downsample_interval
+        
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+    
+    def ensure_collection(self):
+        """Создание time-series коллекции наблюдений (или обновление срока хранения существующей)"""
+        if self.collection.name not in self.database.list_collection_names():
+            self.database.create_collection(
+                self.collection.name,
+                timeseries={"timeField": "observed_at", "metaField": "address", "granularity": "seconds"},
+                expireAfterSeconds=self.retention
+            )
+        else:
+            self.database.command("collMod", self.collection.name, expireAfterSeconds=self.retention)
+    
+    def indexes(self):
+        """Индексы коллекций истории в формате INDEXES"""
+        return {
+            self.collection.name: [
+                IndexModel([("address", ASCENDING), ("observed_at", ASCENDING)], name="address_observed_at")
+            ],
+            self.downsampled_collection.name: [
+                IndexModel([("address", ASCENDING), ("bucket", ASCENDING)], name="address_bucket"),
+                IndexModel([("bucket", ASCENDING)], name="bucket_ttl", expireAfterSeconds=self.downsampled_retention)
+            ]
+        }
+    
+    def write(self, samples):
+        """Запись наблюдений (адрес, процент, время) одним insert_many"""
+        self.collection.insert_many(
+            [
+                {"address": address, "percentage": percentage, "observed_at": observed_at}
+                for address, percentage, observed_at in samples
+            ],
+            ordered=False
+        )
+        self._ensure_thread()
+    
+    def downsample(self, now=None):
+        """Свертка наблюдений последних завершенных интервалов в migration_history_downsampled.
+        Интервалы пересчитываются целиком и заменяются ($merge), поэтому повторный запуск безопасен"""
+        now = now or datetime.now()
+        
+        # Текущий интервал еще не завершен; захватываем несколько предыдущих на случай пропущенного запуска
+        end = now - timedelta(seconds=(now - datetime(1970, 1, 1)).total_seconds() % self.bucket)
+        start = end - timedelta(seconds=self.bucket * (self.downsample_interval // self.bucket + 2))
+        
+        self.collection.aggregate([
+            {"$match": {"observed_at": {"$gte": start, "$lt": end}}},
+            {"$sort": {"observed_at": 1}},
+            {
+                "$group": {
+                    "_id": {
+                        "address": "$address",
+                        "bucket": {"$dateTrunc": {"date": "$observed_at", "unit": "second", "binSize": self.bucket}}
+                    },
+                    "first": {"$first": "$percentage"},
+                    "last": {"$last": "$percentage"},
+                    "min": {"$min": "$percentage"},
+                    "max": {"$max": "$percentage"},
+                    "samples": {"$sum": 1}
+                }
+            },
+            {"$set": {"address": "$_id.address", "bucket": "$_id.bucket"}},
+            {"$merge": {"into": self.downsampled_collection.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ])
+    
+    def get_trajectory(self, address, since=None, until=None):
+        """Траектория процента миграции: список (время, процент) по возрастанию времени.
+        За период, для которого наблюдения уже удалены, берется последнее значение каждого интервала свертки"""
+        until = until or datetime.now()
+        since = since or until - timedelta(seconds=self.retention)
+        raw_since = max(since, datetime.now() - timedelta(seconds=self.retention))
+        
+        points = []
+        if since < raw_since:
+            points.extend(
+                (document["bucket"], document["last"])
+                for document in self.downsampled_collection.find(
+                    {"address": address, "bucket": {"$gte": since, "$lt": raw_since}},
+                    {"_id": 0, "bucket": 1, "last": 1}
+                ).sort("bucket", ASCENDING)
+            )
+        
+        points.extend(
+            (document["observed_at"], document["percentage"])
+            for document in self.collection.find(
+                {"address": address, "observed_at": {"$gte": raw_since, "$lte": until}},
+                {"_id": 0, "observed_at": 1, "percentage": 1}
+            ).sort("observed_at", ASCENDING)
+        )
+        return points
+    
+    def get_velocity(self, address, window=300):
+        """Скорость роста процента миграции (процентов в секунду) за последние window секунд; None, если данных мало"""
+        points = self.get_trajectory(address, since=datetime.now() - timedelta(seconds=window))
+        if len(points) < 2:
+            return None
+        
+        (first_time, first_percentage), (last_time, last_percentage) = points[0], points[-1]
+        elapsed = (last_time - first_time).total_seconds()
+        return (last_percentage - first_percentage) / elapsed if elapsed > 0 else None
+    
+    def _ensure_thread(self):
+        """Запуск периодической свертки при первой записи"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.stopped.clear()
+                    self.thread = threading.Thread(target=self._run, name="migration-history-downsample")
+                    self.thread.daemon = True
+                    self.thread.start()
+    
+    def _run(self):
+        """Периодическая свертка наблюдений"""
+        while not self.stopped.wait(self.downsample_interval):
+            try:
+                self.downsample()
+            except Exception as e:
+                print(f"Ошибка при свертке истории процентов миграции: {str(e)}")
+    
+    def stop(self):
+        """Остановка периодической свертки"""
+        self.stopped.set()
 
 class Transaction:
     """Модель транзакции покупки/продажи токена"""
@@ -141,7 +556,7 @@ class Transaction:
     
     @staticmethod
     def create_purchase(user_id, token_address, token_name, token_symbol, purchase_price, 
-                      purchase_amount, purchase_sol):
+                      purchase_amount, purchase_sol, signature=None, confirmation_status=None):
         """Создание новой записи о покупке токена"""
         transaction_data = {
             "user_id": user_id,
@@ -151,18 +566,24 @@ class Transaction:
             "purchase_price": purchase_price,
             "purchase_amount": purchase_amount,
             "purchase_sol": purchase_sol,
+            "signature": signature,
+            "confirmation_status": confirmation_status,
             "status": "bought",
             "created_at": datetime.now(),
             "updated_at": datetime.now()
         }
         
         result = Transaction.collection.insert_one(transaction_data)
+        
+        if USER_STATS_SUMMARY:
+            Transaction._increment_stats(user_id, {"total_trades": 1})
+        
         return result.inserted_id
     
     @staticmethod
     def update_sale(transaction_id, sell_price, sell_amount, profit_percentage):
         """Обновление транзакции после продажи токена"""
-        Transaction.collection.update_one(
+        previous = Transaction.collection.find_one_and_update(
             {"_id": transaction_id},
             {
                 "$set": {
@@ -172,8 +593,34 @@ class Transaction:
                     "status": "sold",
                     "updated_at": datetime.now()
                 }
-            }
+            },
+            projection={"user_id": 1, "status": 1, "purchase_price": 1, "purchase_amount": 1}
         )
+        
+        # Продажа учитывается в статистике один раз (повторное обновление уже проданной транзакции не считается)
+        if USER_STATS_SUMMARY and previous and previous.get("status") != "sold":
+            increments = {"successful_trades": 1 if profit_percentage > 0 else 0}
+            if previous.get("purchase_price") is not None and previous.get("purchase_amount") is not None:
+                increments["total_profit"] = (sell_price * sell_amount) - (previous["purchase_price"] * previous["purchase_amount"])
+            Transaction._increment_stats(previous["user_id"], increments)
+    
+    @staticmethod
+    def update_confirmation(transaction_id, confirmation_status, time_to_confirm=None, error=None):
+        """Результат подтверждения транзакции покупки (неподтвержденная покупка помечается как неудачная).
+        Возвращает False, если запись не изменена"""
+        query = {"_id": transaction_id}
+        update = {
+            "confirmation_status": confirmation_status,
+            "time_to_confirm": time_to_confirm,
+            "updated_at": datetime.now()
+        }
+        if confirmation_status != "confirmed":
+            # Уже проданную позицию не переписываем
+            query["status"] = "bought"
+            update["status"] = "failed"
+            update["confirmation_error"] = error
+        
+        return Transaction.collection.update_one(query, {"$set": update}).matched_count > 0
     
     @staticmethod
     def find_purchase(user_id, token_address):
@@ -185,32 +632,222 @@ class Transaction:
         })
     
     @staticmethod
-    def get_user_transactions(user_id):
-        """Получение всех транзакций пользователя"""
-        return list(Transaction.collection.find({"user_id": user_id}).sort("created_at", -1))
+    def get_user_transactions(user_id, limit=None, after=None, projection=None, stream=False):
+        """Получение транзакций пользователя от новых к старым (страница после курсора after, если задан limit;
+        при stream=True - курсор)"""
+        cursor = keyset_find(
+            Transaction.collection, {"user_id": user_id}, "created_at", DESCENDING,
+            after=after, limit=limit, projection=projection
+        )
+        return cursor if stream else list(cursor)
     
     @staticmethod
-    def get_user_stats(user_id):
-        """Получение статистики торговли пользователя"""
-        all_transactions = list(Transaction.collection.find({"user_id": user_id}))
+    def aggregate_user_stats(user_id):
+        """Подсчет статистики пользователя на стороне MongoDB (один документ вместо всех транзакций)"""
+        sold = {"$eq": ["$status", "sold"]}
+        has_prices = {"$and": [
+            {"$gt": ["$sell_price", None]},
+            {"$gt": ["$sell_amount", None]},
+            {"$gt": ["$purchase_price", None]},
+            {"$gt": ["$purchase_amount", None]}
+        ]}
         
-        total_trades = len(all_transactions)
-        successful_trades = len([t for t in all_transactions if t.get("status") == "sold" and t.get("profit_percentage", 0) > 0])
+        result = list(Transaction.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {
+                "$group": {
+                    "_id": None,
+                    "total_trades": {"$sum": 1},
+                    "successful_trades": {
+                        "$sum": {"$cond": [{"$and": [sold, {"$gt": [{"$ifNull": ["$profit_percentage", 0]}, 0]}]}, 1, 0]}
+                    },
+                    "total_profit": {
+                        "$sum": {"$cond": [
+                            {"$and": [sold, has_prices]},
+                            {"$subtract": [
+                                {"$multiply": ["$sell_price", "$sell_amount"]},
+                                {"$multiply": ["$purchase_price", "$purchase_amount"]}
+                            ]},
+                            0
+                        ]}
+                    }
+                }
+            }
+        ]))
         
-        total_profit_sol = 0
-        for t in all_transactions:
-            if t.get("status") == "sold" and "sell_price" in t and "sell_amount" in t and "purchase_price" in t and "purchase_amount" in t:
-                total_profit_sol += (t["sell_price"] * t["sell_amount"]) - (t["purchase_price"] * t["purchase_amount"])
+        if not result:
+            return {"total_trades": 0, "successful_trades": 0, "total_profit": 0}
         
         return {
-            "total_trades": total_trades,
-            "successful_trades": successful_trades,
-            "total_profit": round(total_profit_sol, 4)
+            "total_trades": result[0]["total_trades"],
+            "successful_trades": result[0]["successful_trades"],
+            "total_profit": result[0]["total_profit"]
         }
+    
+    @staticmethod
+    def _increment_stats(user_id, increments):
+        """Изменение документа статистики (только существующего: отсутствующий создается из агрегации)"""
+        UserStats.collection.update_one(
+            {"_id": user_id},
+            {"$inc": increments, "$set": {"updated_at": datetime.now()}}
+        )
+    
+    @staticmethod
+    def rebuild_user_stats(user_id):
+        """Пересчет документа статистики пользователя из транзакций"""
+        stats = Transaction.aggregate_user_stats(user_id)
+        UserStats.collection.update_one(
+            {"_id": user_id},
+            {"$set": {**stats, "updated_at": datetime.now()}},
+            upsert=True
+        )
+        return stats
+    
+    @staticmethod
+    def get_user_stats(user_id):
+        """Получение статистики торговли пользователя"""
+        if USER_STATS_SUMMARY:
+            stats = UserStats.collection.find_one({"_id": user_id})
+            if stats is None:
+                stats = Transaction.rebuild_user_stats(user_id)
+        else:
+            stats = Transaction.aggregate_user_stats(user_id)
+        
+        return {
+            "total_trades": stats["total_trades"],
+            "successful_trades": stats["successful_trades"],
+            "total_profit": round(stats["total_profit"], 4)
+        }
+
+class UserStats:
+    """Документ статистики торговли пользователя (_id - идентификатор пользователя)"""
+    
+    collection = db["user_stats"]
+
+# Индексы, необходимые запросам моделей (имена фиксированы, чтобы сверять их с существующими)
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("telegram_chat_id", ASCENDING)], name="telegram_chat_id"),
+        IndexModel([("active", ASCENDING)], name="active"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at")
+    ],
+    "tokens": [
+        IndexModel([("address", ASCENDING)], name="address_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status")
+    ],
+    "transactions": [
+        IndexModel([("user_id", ASCENDING), ("token_address", ASCENDING), ("status", ASCENDING)], name="user_token_status"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created_at")
+    ]
+}
+
+# Запросы горячего пути для проверки плана выполнения: (коллекция, фильтр, сортировка)
+HOT_QUERIES = [
+    ("users", {"username": ""}, None),
+    ("users", {"telegram_chat_id": ""}, None),
+    ("users", {"active": True}, None),
+    ("tokens", {"address": ""}, None),
+    ("tokens", {"status": "tracking"}, [("_id", ASCENDING)]),
+    ("transactions", {"user_id": ObjectId(), "token_address": "", "status": "bought"}, None),
+    ("transactions", {"user_id": ObjectId()}, [("created_at", DESCENDING), ("_id", DESCENDING)])
+]
+
+def ensure_indexes():
+    """Создание недостающих индексов и пересоздание индексов, описание которых изменилось"""
+    created = []
+    indexes_by_collection = dict(INDEXES)
+    
+    # Коллекция истории создается как time-series до создания индексов (иначе она была бы создана обычной)
+    if migration_history is not None:
+        migration_history.ensure_collection()
+        indexes_by_collection.update(migration_history.indexes())
+    
+    for collection_name, indexes in indexes_by_collection.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        
+        for index in indexes:
+            spec = index.document
+            current = existing.get(spec["name"])
+            
+            if current is not None and (
+                list(current["key"]) != list(spec["key"].items()) or
+                bool(current.get("unique")) != bool(spec.get("unique")) or
+                current.get("expireAfterSeconds") != spec.get("expireAfterSeconds")
+            ):
+                print(f"Индекс {collection_name}.{spec['name']} изменился, пересоздаем")
+                collection.drop_index(spec["name"])
+                current = None
+            
+            if current is None:
+                # Ошибка (например, дубликаты при уникальном индексе) не скрывается: без индекса запуск бессмыслен
+                collection.create_indexes([index])
+                created.append(f"{collection_name}.{spec['name']}")
+    
+    if created:
+        print(f"Созданы индексы: {', '.join(created)}")
+    
+    return created
+
+def find_plan_stages(plan, stage):
+    """Поиск стадии в дереве плана выполнения (inputStage, inputStages, queryPlan)"""
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return True
+        return any(find_plan_stages(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(find_plan_stages(value, stage) for value in plan)
+    return False
+
+def check_query_plans():
+    """Проверка, что запросы горячего пути используют индексы; при полном сканировании - исключение"""
+    collscans = []
+    
+    for collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if find_plan_stages(plan, "COLLSCAN"):
+            collscans.append(f"{collection_name} {query}")
+    
+    if collscans:
+        raise RuntimeError(f"Запросы выполняются полным сканированием коллекции (COLLSCAN): {'; '.join(collscans)}")
+
+# История процентов миграции
+migration_history = MigrationHistory(
+    db,
+    MIGRATION_HISTORY_RETENTION,
+    MIGRATION_HISTORY_BUCKET,
+    MIGRATION_HISTORY_DOWNSAMPLED_RETENTION,
+    MIGRATION_HISTORY_DOWNSAMPLE_INTERVAL
+) if MIGRATION_HISTORY_ENABLED else None
+
+# Буфер отложенной записи процентов миграции
+migration_write_buffer = MigrationWriteBuffer(
+    lambda: Token.collection,
+    float(os.environ.get("MIGRATION_FLUSH_INTERVAL", 1)),
+    int(os.environ.get("MIGRATION_FLUSH_SIZE", 500)),
+    history=migration_history
+)
+
+# Записываем остаток буфера при завершении процесса
+atexit.register(migration_write_buffer.flush)
 
 # Экспортируем классы для использования в других модулях
 __all__ = [
     'User',
     'Token',
-    'Transaction'
+    'Transaction',
+    'UserStats',
+    'MigrationWriteBuffer',
+    'MigrationHistory',
+    'migration_history',
+    'keyset_find',
+    'encode_cursor',
+    'decode_cursor',
+    'ensure_indexes',
+    'check_query_plans'
 ]
\ No newline at end of file
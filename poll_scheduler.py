@@ -0,0 +1,153 @@
+# poll_scheduler.py - Адаптивное расписание опроса токенов
+
+import heapq
+import itertools
+import time
+
+class PollEntry:
+    """Состояние опроса одного токена (__slots__ вместо словаря для экономии памяти)"""
+
+    __slots__ = ("percentage", "velocity", "interval", "observed_at", "seq", "due")
+
+    def __init__(self, percentage, interval, observed_at):
+        self.percentage = percentage
+        self.velocity = 0.0
+        self.interval = interval
+        self.observed_at = observed_at
+        self.seq = None
+        self.due = None
+
+class PollScheduler:
+    """Очередь с приоритетом: время следующего опроса токена зависит от процента и скорости миграции"""
+
+    def __init__(self, threshold, min_interval=0.5, max_interval=300, base_interval=5, near_margin=5):
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.base_interval = base_interval
+        self.near_margin = near_margin
+
+        # Куча (время опроса, порядковый номер, адрес); устаревшие записи пропускаются
+        self.heap = []
+        self.counter = itertools.count()
+
+        # Состояние токенов: процент, скорость, текущий интервал и актуальный номер записи в куче
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, token_address):
+        return token_address in self.entries
+
+    def _push(self, token_address, due):
+        """Постановка токена в очередь на указанное время"""
+        entry = self.entries[token_address]
+        entry.seq = next(self.counter)
+        entry.due = due
+        heapq.heappush(self.heap, (due, entry.seq, token_address))
+
+    def add(self, token_address, percentage=None, now=None):
+        """Добавление токена; первый опрос выполняется сразу (percentage=None - процент еще не наблюдался)"""
+        if token_address in self.entries:
+            return
+
+        now = time.monotonic() if now is None else now
+        self.entries[token_address] = PollEntry(percentage, self.base_interval, now)
+        self._push(token_address, now)
+
+    def remove(self, token_address):
+        """Удаление токена из расписания"""
+        self.entries.pop(token_address, None)
+
+    def pop_due(self, now=None):
+        """Извлечение всех токенов, время опроса которых наступило"""
+        now = time.monotonic() if now is None else now
+        due_tokens = []
+
+        while self.heap and self.heap[0][0] <= now:
+            due, seq, token_address = heapq.heappop(self.heap)
+            entry = self.entries.get(token_address)
+
+            # Запись устарела: токен удален или перепланирован
+            if entry is None or entry.seq != seq:
+                continue
+
+            entry.seq = None
+            due_tokens.append(token_address)
+
+        return due_tokens
+
+    def restore(self, token_addresses, now=None):
+        """Возврат в очередь извлеченных токенов, для которых не было ни record, ни retry (ошибка при обработке)"""
+        for token_address in token_addresses:
+            entry = self.entries.get(token_address)
+            if entry is not None and entry.seq is None:
+                self.retry(token_address, now=now)
+
+    def next_due_in(self, now=None):
+        """Время в секундах до ближайшего опроса (None, если очередь пуста)"""
+        now = time.monotonic() if now is None else now
+
+        while self.heap:
+            due, seq, token_address = self.heap[0]
+            entry = self.entries.get(token_address)
+            if entry is None or entry.seq != seq:
+                heapq.heappop(self.heap)
+                continue
+            return max(0, due - now)
+
+        return None
+
+    def compute_interval(self, percentage, velocity, previous_interval):
+        """Расчет интервала опроса по проценту миграции и скорости его роста (% в секунду)"""
+        remaining = self.threshold - percentage
+
+        # Токен у порога опрашиваем максимально часто
+        if remaining <= self.near_margin:
+            return self.min_interval
+
+        # Растущий токен: опрашиваем несколько раз до ожидаемого достижения порога
+        if velocity > 0:
+            time_to_threshold = remaining / velocity
+            return min(self.max_interval, max(self.min_interval, time_to_threshold / 4))
+
+        # Стоящий токен: экспоненциально увеличиваем интервал
+        return min(self.max_interval, max(self.min_interval, previous_interval * 2))
+
+    def record(self, token_address, percentage, now=None):
+        """Учет нового значения процента и планирование следующего опроса"""
+        entry = self.entries.get(token_address)
+        if entry is None:
+            return None
+
+        now = time.monotonic() if now is None else now
+        elapsed = now - entry.observed_at
+
+        # Первое наблюдение не дает скорости: выдуманная база 0% дала бы ложный всплеск и частый опрос
+        if entry.percentage is not None and elapsed > 0:
+            # Сглаженная скорость роста процента миграции
+            velocity = (percentage - entry.percentage) / elapsed
+            entry.velocity = 0.5 * entry.velocity + 0.5 * velocity
+
+        entry.percentage = percentage
+        entry.observed_at = now
+        entry.interval = self.compute_interval(percentage, entry.velocity, entry.interval)
+
+        self._push(token_address, now + entry.interval)
+        return entry.interval
+
+    def retry(self, token_address, delay=None, now=None):
+        """Повторное планирование токена без нового значения (ошибка или таймаут проверки)"""
+        entry = self.entries.get(token_address)
+        if entry is None:
+            return
+
+        now = time.monotonic() if now is None else now
+        self._push(token_address, now + (entry.interval if delay is None else delay))
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'PollEntry',
+    'PollScheduler'
+]
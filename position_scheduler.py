@@ -0,0 +1,109 @@
+# position_scheduler.py - Планировщик отложенных продаж открытых позиций
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+class PositionScheduler:
+    """Один поток с мин-кучей сроков продажи; наступившие задачи выполняет ограниченный пул потоков"""
+
+    def __init__(self, max_workers=16):
+        self.max_workers = max_workers
+        self.executor = None
+
+        # Куча (срок, идентификатор задачи) и задачи: идентификатор -> (функция, args, kwargs)
+        self.heap = []
+        self.jobs = {}
+        self.ids = itertools.count(1)
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def __len__(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def schedule(self, delay, function, *args, **kwargs):
+        """Планирование вызова через delay секунд; возвращает идентификатор задачи для отмены"""
+        with self.condition:
+            job_id = next(self.ids)
+            self.jobs[job_id] = (function, args, kwargs)
+            heapq.heappush(self.heap, (time.monotonic() + delay, job_id))
+            self._ensure_thread()
+            self.condition.notify()
+            return job_id
+
+    def cancel(self, job_id):
+        """Отмена запланированной задачи (запись в куче пропускается при извлечении)"""
+        with self.condition:
+            return self.jobs.pop(job_id, None) is not None
+
+    def _ensure_thread(self):
+        """Запуск потока планировщика и пула при первом использовании (вызывается под блокировкой)"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="position")
+
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped = False
+            self.thread = threading.Thread(target=self._run, name="position-scheduler")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        """Ожидание ближайшего срока и передача наступивших задач в пул"""
+        with self.condition:
+            while not self.stopped:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                due, job_id = self.heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                heapq.heappop(self.heap)
+                job = self.jobs.pop(job_id, None)
+
+                # Задача была отменена
+                if job is None:
+                    continue
+
+                function, args, kwargs = job
+                self.executor.submit(self._execute, function, args, kwargs)
+
+    @staticmethod
+    def _execute(function, args, kwargs):
+        """Выполнение задачи с перехватом ошибок"""
+        try:
+            function(*args, **kwargs)
+        except Exception as e:
+            print(f"Ошибка при выполнении отложенной задачи: {str(e)}")
+
+    def stop(self):
+        """Остановка планировщика (невыполненные задачи отбрасываются)"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+# Общий планировщик продаж для всего процесса
+position_scheduler = PositionScheduler(int(os.environ.get("SELL_WORKERS", 16)))
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'PositionScheduler',
+    'position_scheduler'
+]
@@ -0,0 +1,252 @@
+# rate_limiter.py - Ограничение частоты запросов к внешним API по хостам
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Коды ответа, после которых запрос повторяется с задержкой
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class DeadlineExceeded(TimeoutError):
+    """Бюджет времени цикла исчерпан до отправки запроса или повтора"""
+
+class TokenBucket:
+    """Корзина токенов: rate запросов в секунду с допустимым всплеском burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+        # Пауза по Retry-After: до этого момента токены не выдаются
+        self.blocked_until = 0
+
+        self.condition = threading.Condition()
+        self.waiting = 0
+
+    def _refill(self, now):
+        """Пополнение корзины за прошедшее время (вызывается под блокировкой); во время паузы не пополняется"""
+        if now > self.updated_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def acquire(self, timeout=None):
+        """Ожидание токена; возвращает время ожидания или None, если истек timeout"""
+        started = time.monotonic()
+
+        with self.condition:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+
+                    if now >= self.blocked_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return now - started
+
+                    delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+                    if timeout is not None:
+                        remaining = started + timeout - now
+                        if remaining <= 0:
+                            return None
+                        delay = min(delay, remaining)
+
+                    self.condition.wait(delay)
+            finally:
+                self.waiting -= 1
+
+    def block(self, seconds):
+        """Пауза выдачи токенов (ответ 429 с Retry-After)"""
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0)
+            self.updated_at = max(self.updated_at, self.blocked_until)
+            self.condition.notify_all()
+
+class RateLimiter:
+    """Общий ограничитель частоты: корзина токенов на каждый хост, повтор 429/5xx с Retry-After и джиттером"""
+
+    def __init__(self, default_rate=10, default_burst=20, limits=None, max_retries=3,
+                 base_backoff=0.5, max_backoff=30, acquire_timeout=30):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.acquire_timeout = acquire_timeout
+
+        self.buckets = {}
+        self.metrics_by_host = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url):
+        """Хост URL, по которому ведется учет лимита"""
+        return urlsplit(url).netloc
+
+    def bucket(self, host):
+        """Корзина хоста (создается при первом обращении)"""
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                rate, burst = self.limits.get(host, (self.default_rate, self.default_burst))
+                bucket = self.buckets[host] = TokenBucket(rate, burst)
+                self.metrics_by_host[host] = {
+                    "requests": 0,
+                    "throttled": 0,
+                    "server_errors": 0,
+                    "retries": 0,
+                    "rejected": 0,
+                    "wait_time": 0.0
+                }
+            return bucket
+
+    def _count(self, host, key, value=1):
+        with self.lock:
+            self.metrics_by_host[host][key] += value
+
+    def acquire(self, url, timeout=None):
+        """Ожидание разрешения на запрос к хосту URL (не дольше timeout или acquire_timeout)"""
+        host = self.host_of(url)
+        timeout = self.acquire_timeout if timeout is None else min(timeout, self.acquire_timeout)
+        waited = self.bucket(host).acquire(timeout)
+
+        if waited is None:
+            self._count(host, "rejected")
+            raise TimeoutError(f"Превышено время ожидания лимита запросов к {host}")
+
+        self._count(host, "wait_time", waited)
+        return host
+
+    @staticmethod
+    def retry_after(response):
+        """Задержка из заголовка Retry-After (секунды или HTTP-дата); None, если заголовка нет"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt):
+        """Экспоненциальная задержка с полным джиттером"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    def request(self, method, url, session=None, max_retries=None, acquire_timeout=None,
+                budget=None, timeout_function=None, **kwargs):
+        """HTTP-запрос с учетом лимита хоста; 429 и 5xx повторяются до max_retries раз.
+        budget - функция, возвращающая оставшийся бюджет времени в секундах (None - без ограничения): ожидание
+        лимита ограничено им, а попытка или пауза, не укладывающаяся в бюджет, прерывается DeadlineExceeded.
+        timeout_function - таймауты запроса, которые вычисляются заново перед каждой попыткой"""
+        send = (session or requests).request
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        for attempt in range(max_retries + 1):
+            wait_timeout = acquire_timeout
+            remaining = budget() if budget is not None else None
+            if remaining is not None:
+                if remaining <= 0:
+                    raise DeadlineExceeded("Бюджет времени цикла исчерпан")
+                wait_timeout = remaining if wait_timeout is None else min(wait_timeout, remaining)
+
+            if timeout_function is not None:
+                kwargs["timeout"] = timeout_function()
+
+            host = self.acquire(url, wait_timeout)
+            self._count(host, "requests")
+            response = send(method, url, **kwargs)
+
+            if response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == max_retries:
+                self._count(host, "throttled" if response.status_code == 429 else "server_errors")
+                return response
+
+            self._count(host, "retries")
+            delay = self.retry_after(response)
+            if delay is None:
+                delay = self.backoff(attempt)
+            delay = min(self.max_backoff, delay)
+
+            if response.status_code == 429:
+                # Хост просит подождать: пауза для всех запросов к нему, повтор дождется ее в acquire
+                self._count(host, "throttled")
+                self.bucket(host).block(delay)
+            else:
+                self._count(host, "server_errors")
+
+            # Пауза, которая не уложится в бюджет, бессмысленна: сразу сообщаем об исчерпании
+            remaining = budget() if budget is not None else None
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded(f"Повтор через {delay:.1f} с не укладывается в бюджет цикла ({max(0.0, remaining):.1f} с)")
+
+            if response.status_code != 429:
+                time.sleep(delay)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def metrics(self):
+        """Счетчики и текущая очередь ожидания по хостам"""
+        with self.lock:
+            return {
+                host: dict(
+                    metrics,
+                    queue_depth=self.buckets[host].waiting,
+                    tokens=round(self.buckets[host].tokens, 2),
+                    blocked_for=max(0.0, self.buckets[host].blocked_until - time.monotonic())
+                )
+                for host, metrics in self.metrics_by_host.items()
+            }
+
+def parse_limits(value):
+    """Лимиты хостов из строки вида "api.pump.fun=20:40,api.raydium.io=10" (запросов в секунду:всплеск)"""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        host, limit = item.split("=", 1)
+        rate, _, burst = limit.partition(":")
+        limits[host.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+# Общий ограничитель для всех запросов к внешним API
+rate_limiter = RateLimiter(
+    float(os.environ.get("RATE_LIMIT_DEFAULT_RPS", 50)),
+    float(os.environ.get("RATE_LIMIT_DEFAULT_BURST", 100)),
+    parse_limits(os.environ.get("RATE_LIMITS")),
+    int(os.environ.get("RATE_LIMIT_MAX_RETRIES", 3))
+)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'TokenBucket',
+    'RateLimiter',
+    'DeadlineExceeded',
+    'parse_limits',
+    'rate_limiter'
+]
@@ -0,0 +1,205 @@
+# rpc_pool.py - Пул RPC-нод Solana с выбором по задержке и дублированием запросов
+
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from http_client import http_client
+
+class RpcError(RuntimeError):
+    """Ошибка, возвращенная нодой в поле error (повтор на другой ноде не поможет)"""
+
+class RpcEndpoint:
+    """Скользящее окно задержек и ошибок одной ноды"""
+
+    def __init__(self, url, window=100):
+        self.url = url
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.unhealthy_until = 0
+        self.requests = 0
+        self.errors = 0
+
+    def latency_percentile(self, percent):
+        """Перцентиль задержки успешных запросов (None, пока замеров нет)"""
+        if not self.latencies:
+            return None
+        values = sorted(self.latencies)
+        index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+        return values[index]
+
+    def error_rate(self):
+        """Доля ошибок в окне"""
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class RpcPool:
+    """Запрос уходит на самую быструю здоровую ноду; критичные запросы дублируются на вторую после задержки"""
+
+    def __init__(self, urls, window=100, max_error_rate=0.5, cooldown=10, error_threshold=3,
+                 hedge_percentile=90, hedge_min_delay=0.05, max_workers=32):
+        self.endpoints = [RpcEndpoint(url, window) for url in urls]
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.error_threshold = error_threshold
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.max_workers = max_workers
+
+        self.lock = threading.Lock()
+        self.executor = None
+        self.ids = itertools.count(1)
+
+        self.stats = {
+            "requests": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "failovers": 0
+        }
+
+    def _ranked(self):
+        """Ноды по возрастанию медианной задержки; нездоровые в конце (вызывается под блокировкой)"""
+        now = time.monotonic()
+
+        def key(endpoint):
+            healthy = endpoint.unhealthy_until <= now and endpoint.error_rate() <= self.max_error_rate
+            latency = endpoint.latency_percentile(50)
+
+            # Ноды без замеров пробуются первыми среди здоровых
+            return (not healthy, 0 if latency is None else latency)
+
+        return sorted(self.endpoints, key=key)
+
+    def _record(self, endpoint, latency, success):
+        """Учет результата запроса к ноде"""
+        with self.lock:
+            endpoint.requests += 1
+            endpoint.outcomes.append(success)
+
+            if success:
+                endpoint.latencies.append(latency)
+                endpoint.consecutive_errors = 0
+            else:
+                endpoint.errors += 1
+                endpoint.consecutive_errors += 1
+                if endpoint.consecutive_errors >= self.error_threshold:
+                    endpoint.unhealthy_until = time.monotonic() + self.cooldown
+
+    def _call(self, endpoint, method, params, timeout):
+        """Один JSON-RPC запрос к ноде с замером задержки"""
+        started = time.perf_counter()
+        try:
+            # Лимит частоты общий с остальными запросами к хосту; повтор после 429 - на другой ноде
+            response = http_client.post(
+                endpoint.url,
+                json={"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params or []},
+                timeout=timeout,
+                max_retries=0 if len(self.endpoints) > 1 else None
+            )
+            response.raise_for_status()
+            payload = response.json()
+        except Exception:
+            self._record(endpoint, time.perf_counter() - started, False)
+            raise
+
+        # Ошибка RPC - ответ ноды, а не сбой: нода остается здоровой
+        self._record(endpoint, time.perf_counter() - started, True)
+
+        if "error" in payload:
+            raise RpcError(f"RPC {method}: {payload['error']}")
+
+        return payload["result"]
+
+    def _ensure_executor(self):
+        """Пул потоков для дублированных запросов создается при первом использовании"""
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rpc-hedge")
+
+    def hedge_delay(self, endpoint):
+        """Задержка перед дублированием: перцентиль задержки основной ноды"""
+        with self.lock:
+            latency = endpoint.latency_percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, latency or 0)
+
+    def request(self, method, params=None, timeout=10, hedge=False):
+        """JSON-RPC запрос; при сбое ноды - повтор на следующей по рейтингу"""
+        with self.lock:
+            endpoints = self._ranked()
+            self.stats["requests"] += 1
+
+        if hedge and len(endpoints) > 1:
+            return self._hedged(endpoints, method, params, timeout)
+
+        last_error = None
+        for attempt, endpoint in enumerate(endpoints):
+            try:
+                return self._call(endpoint, method, params, timeout)
+            except RpcError:
+                raise
+            except Exception as e:
+                last_error = e
+                if attempt + 1 < len(endpoints):
+                    with self.lock:
+                        self.stats["failovers"] += 1
+
+        raise last_error
+
+    def _hedged(self, endpoints, method, params, timeout):
+        """Запрос к лучшей ноде и дубль ко второй, если ответ не пришел за перцентильную задержку"""
+        self._ensure_executor()
+        primary, secondary = endpoints[0], endpoints[1]
+
+        futures = {self.executor.submit(self._call, primary, method, params, timeout): primary}
+        done, pending = wait(futures, timeout=self.hedge_delay(primary))
+
+        # Основная нода не успела или сразу вернула сбой - дублируем запрос
+        if not done or next(iter(done)).exception() is not None:
+            with self.lock:
+                self.stats["hedged"] += 1
+            futures[self.executor.submit(self._call, secondary, method, params, timeout)] = secondary
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if futures[future] is not primary:
+                        with self.lock:
+                            self.stats["hedge_wins"] += 1
+                    return future.result()
+                if isinstance(error, RpcError):
+                    raise error
+                last_error = error
+
+        raise last_error
+
+    def endpoint_stats(self):
+        """Задержки и доля ошибок по нодам"""
+        with self.lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "requests": endpoint.requests,
+                    "errors": endpoint.errors,
+                    "error_rate": endpoint.error_rate(),
+                    "latency_p50": endpoint.latency_percentile(50),
+                    "latency_p90": endpoint.latency_percentile(90),
+                    "healthy": endpoint.unhealthy_until <= time.monotonic()
+                }
+                for endpoint in self.endpoints
+            ]
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'RpcError',
+    'RpcEndpoint',
+    'RpcPool'
+]
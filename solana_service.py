@@ -1,42 +1,310 @@
 # solana_service.py - Сервис для работы с Solana блокчейном
 
 import base58
+import base64
 import json
-import requests
-from solana.rpc.api import Client
-from solana.transaction import Transaction
+import struct
+from solana.transaction import Transaction, TransactionInstruction
 from solana.keypair import Keypair
 from solana.publickey import PublicKey
 from solana.system_program import SYS_PROGRAM_ID, TransferParams, transfer
 from solders.instruction import Instruction
+from solders.pubkey import Pubkey
 from base58 import b58encode, b58decode
 import time
+import threading
 import os
+from cachetools import LRUCache, TTLCache
 from dotenv import load_dotenv
 
+from http_client import http_client, is_upstream_error, is_upstream_status, is_local_timeout
+from rpc_pool import RpcPool
+from fee_oracle import FeeOracle
+
 # Загрузка переменных окружения
 load_dotenv()
 
-# Инициализация клиента Solana
-solana_client = Client(os.environ.get("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com"))
+# Адрес RPC-ноды Solana
+SOLANA_RPC_URL = os.environ.get("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com")
+
+# Пул RPC-нод: SOLANA_RPC_URLS через запятую (по умолчанию одна нода SOLANA_RPC_URL)
+SOLANA_RPC_URLS = [
+    url.strip() for url in (os.environ.get("SOLANA_RPC_URLS") or SOLANA_RPC_URL).split(",") if url.strip()
+]
+rpc_pool = RpcPool(
+    SOLANA_RPC_URLS,
+    hedge_percentile=float(os.environ.get("RPC_HEDGE_PERCENTILE", 90)),
+    hedge_min_delay=float(os.environ.get("RPC_HEDGE_MIN_DELAY", 0.05)),
+    cooldown=float(os.environ.get("RPC_UNHEALTHY_COOLDOWN", 10))
+)
+
+# Функция для JSON-RPC запроса к ноде Solana (возвращает поле result)
+# hedge=True - для критичных по задержке запросов (отправка, блокхеш) дублирование на вторую ноду
+def rpc_request(method, params=None, timeout=10, hedge=False):
+    return rpc_pool.request(method, params, timeout, hedge)
+
+class BlockhashProvider:
+    """Фоновое обновление последнего блокхеша, чтобы не запрашивать его перед каждой транзакцией"""
+    
+    # Среднее время слота и запас блоков до истечения блокхеша
+    SLOT_SECONDS = 0.4
+    SAFETY_BLOCKS = 20
+    
+    def __init__(self, refresh_interval=2, max_age=30):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        
+        self.blockhash = None
+        self.last_valid_block_height = None
+        self.block_height = None
+        self.fetched_at = 0
+        
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        
+        self.stats = {
+            "refreshes": 0,
+            "cache_hits": 0,
+            "sync_fetches": 0,
+            "errors": 0
+        }
+    
+    def _fetch(self):
+        """Запрос последнего блокхеша и текущей высоты блока"""
+        result = rpc_request("getLatestBlockhash", [{"commitment": "confirmed"}], hedge=True)
+        
+        try:
+            block_height = rpc_request("getBlockHeight", [{"commitment": "confirmed"}])
+        except Exception:
+            block_height = None
+        
+        with self.lock:
+            self.blockhash = result["value"]["blockhash"]
+            self.last_valid_block_height = result["value"]["lastValidBlockHeight"]
+            self.block_height = block_height
+            self.fetched_at = time.monotonic()
+            self.stats["refreshes"] += 1
+            return self.blockhash
+    
+    def is_stale(self):
+        """Блокхеш устарел по возрасту или близок к последней допустимой высоте блока"""
+        if self.blockhash is None:
+            return True
+        
+        age = time.monotonic() - self.fetched_at
+        if age > self.max_age:
+            return True
+        
+        if self.block_height is not None and self.last_valid_block_height is not None:
+            estimated_height = self.block_height + age / self.SLOT_SECONDS
+            return estimated_height >= self.last_valid_block_height - self.SAFETY_BLOCKS
+        
+        return False
+    
+    def get(self):
+        """Блокхеш из кэша; если он устарел - синхронный запрос"""
+        self._ensure_thread()
+        
+        with self.lock:
+            if not self.is_stale():
+                self.stats["cache_hits"] += 1
+                return self.blockhash
+            self.stats["sync_fetches"] += 1
+        
+        return self._fetch()
+    
+    def _ensure_thread(self):
+        """Запуск фонового обновления при первом использовании"""
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.stopped.clear()
+                    self.thread = threading.Thread(target=self._run, name="blockhash-provider")
+                    self.thread.daemon = True
+                    self.thread.start()
+    
+    def _run(self):
+        """Периодическое обновление блокхеша"""
+        while not self.stopped.is_set():
+            try:
+                self._fetch()
+            except Exception as e:
+                with self.lock:
+                    self.stats["errors"] += 1
+                print(f"Ошибка при обновлении блокхеша: {str(e)}")
+            
+            self.stopped.wait(self.refresh_interval)
+    
+    def stop(self):
+        """Остановка фонового обновления"""
+        self.stopped.set()
+
+# Общий источник блокхешей для построения транзакций
+blockhash_provider = BlockhashProvider(
+    float(os.environ.get("BLOCKHASH_REFRESH_INTERVAL", 2)),
+    float(os.environ.get("BLOCKHASH_MAX_AGE", 30))
+)
+
+# Программа ComputeBudget: лимит вычислительных единиц и их цена (приоритетная комиссия)
+COMPUTE_BUDGET_PROGRAM_ID = PublicKey("ComputeBudget111111111111111111111111111111")
+SET_COMPUTE_UNIT_LIMIT = 2
+SET_COMPUTE_UNIT_PRICE = 3
+
+# Лимит вычислительных единиц для перевода SOL (перевод и две инструкции ComputeBudget с запасом)
+TRANSFER_COMPUTE_UNIT_LIMIT = int(os.environ.get("TRANSFER_COMPUTE_UNIT_LIMIT", 1000))
+
+# Приоритетная комиссия по перцентилю недавних слотов (обновляется в фоне)
+PRIORITY_FEE_ENABLED = os.environ.get("PRIORITY_FEE_ENABLED", "true").lower() == "true"
+fee_oracle = FeeOracle(
+    rpc_request,
+    float(os.environ.get("PRIORITY_FEE_REFRESH_INTERVAL", 5)),
+    int(os.environ.get("PRIORITY_FEE_WINDOW_SLOTS", 300)),
+    float(os.environ.get("PRIORITY_FEE_PERCENTILE", 75)),
+    int(os.environ.get("PRIORITY_FEE_MIN_PRICE", 0)),
+    int(os.environ.get("PRIORITY_FEE_MAX_PRICE", 1000000)),
+    fallback_price=int(os.environ.get("PRIORITY_FEE_FALLBACK_PRICE", 10000))
+)
+
+# Функция для создания инструкций ComputeBudget (цена в микролампортах за вычислительную единицу)
+def compute_budget_instructions(unit_limit, unit_price=None):
+    if unit_price is None:
+        unit_price = fee_oracle.get_price()
+    
+    return [
+        TransactionInstruction(
+            keys=[],
+            program_id=COMPUTE_BUDGET_PROGRAM_ID,
+            data=struct.pack("<BI", SET_COMPUTE_UNIT_LIMIT, unit_limit)
+        ),
+        TransactionInstruction(
+            keys=[],
+            program_id=COMPUTE_BUDGET_PROGRAM_ID,
+            data=struct.pack("<BQ", SET_COMPUTE_UNIT_PRICE, unit_price)
+        )
+    ]
+
+# Кэш расшифрованных ключей: адрес кошелька -> (приватный ключ base58, Keypair)
+keypair_cache = LRUCache(maxsize=int(os.environ.get("KEYPAIR_CACHE_SIZE", 10000)))
+keypair_cache_lock = threading.Lock()
+keypair_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "decode_seconds": 0.0
+}
+
+# Функция для получения Keypair из приватного ключа (с кэшированием по адресу кошелька)
+def get_keypair(private_key, wallet_address=None):
+    if wallet_address is not None:
+        with keypair_cache_lock:
+            cached = keypair_cache.get(wallet_address)
+            
+            # Ключ пользователя не менялся - используем уже расшифрованный Keypair
+            if cached is not None and cached[0] == private_key:
+                keypair_cache_stats["hits"] += 1
+                return cached[1]
+    
+    started = time.perf_counter()
+    keypair = Keypair.from_secret_key(b58decode(private_key))
+    decode_seconds = time.perf_counter() - started
+    
+    with keypair_cache_lock:
+        keypair_cache[wallet_address or str(keypair.public_key)] = (private_key, keypair)
+        keypair_cache_stats["misses"] += 1
+        keypair_cache_stats["decode_seconds"] += decode_seconds
+    
+    return keypair
+
+# Функция для удаления ключа из кэша (при смене ключа пользователя)
+def invalidate_keypair(wallet_address=None):
+    with keypair_cache_lock:
+        if wallet_address is None:
+            keypair_cache.clear()
+        else:
+            keypair_cache.pop(wallet_address, None)
+
+# Функция для получения статистики кэша ключей
+def get_keypair_cache_stats():
+    with keypair_cache_lock:
+        return {
+            "size": len(keypair_cache),
+            **keypair_cache_stats
+        }
+
+# Кэш балансов кошельков (поглощает повторные запросы во время волны покупок)
+balance_cache = TTLCache(maxsize=int(os.environ.get("BALANCE_CACHE_SIZE", 10000)), ttl=float(os.environ.get("BALANCE_CACHE_TTL", 2)))
+balance_cache_lock = threading.Lock()
+
+# Максимум адресов в одном запросе getMultipleAccounts
+MULTIPLE_ACCOUNTS_LIMIT = 100
+
+# Функция для получения балансов нескольких кошельков (getMultipleAccounts пачками по 100 адресов)
+def get_wallet_balances(wallet_addresses, use_cache=True):
+    balances = {}
+    missing = []
+    
+    with balance_cache_lock:
+        for wallet_address in dict.fromkeys(wallet_addresses):
+            cached = balance_cache.get(wallet_address) if use_cache else None
+            if cached is not None:
+                balances[wallet_address] = cached
+            else:
+                missing.append(wallet_address)
+    
+    errors = {}
+    for start in range(0, len(missing), MULTIPLE_ACCOUNTS_LIMIT):
+        chunk = missing[start:start + MULTIPLE_ACCOUNTS_LIMIT]
+        try:
+            # Данные аккаунтов не нужны, запрашиваем только lamports
+            result = rpc_request("getMultipleAccounts", [
+                chunk,
+                {"encoding": "base64", "dataSlice": {"offset": 0, "length": 0}, "commitment": "confirmed"}
+            ])
+        except Exception as e:
+            print(f"Ошибка при получении балансов {len(chunk)} кошельков: {str(e)}")
+            for wallet_address in chunk:
+                errors[wallet_address] = str(e)
+            continue
+        
+        with balance_cache_lock:
+            for wallet_address, account in zip(chunk, result["value"]):
+                # Несуществующий аккаунт имеет нулевой баланс
+                balance_lamports = account["lamports"] if account else 0
+                balances[wallet_address] = {
+                    "balance_lamports": balance_lamports,
+                    "balance_sol": balance_lamports / 1_000_000_000  # 1 SOL = 1,000,000,000 lamports
+                }
+                balance_cache[wallet_address] = balances[wallet_address]
+    
+    return {
+        "success": not errors,
+        "balances": balances,
+        "errors": errors
+    }
 
 # Функция для получения баланса кошелька
 def get_wallet_balance(wallet_address):
-    try:
-        response = solana_client.get_balance(PublicKey(wallet_address))
-        balance_lamports = response['result']['value']
-        balance_sol = balance_lamports / 1_000_000_000  # 1 SOL = 1,000,000,000 lamports
+    result = get_wallet_balances([wallet_address])
+    
+    if wallet_address in result["balances"]:
         return {
             "success": True,
-            "balance_lamports": balance_lamports,
-            "balance_sol": balance_sol
-        }
-    except Exception as e:
-        print(f"Ошибка при получении баланса кошелька {wallet_address}: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e)
+            **result["balances"][wallet_address]
         }
+    
+    return {
+        "success": False,
+        "error": result["errors"].get(wallet_address, "unknown error")
+    }
+
+# Функция для сброса кэша балансов (например, после перевода)
+def invalidate_balances(wallet_addresses=None):
+    with balance_cache_lock:
+        if wallet_addresses is None:
+            balance_cache.clear()
+        else:
+            for wallet_address in wallet_addresses:
+                balance_cache.pop(wallet_address, None)
 
 # Функция для проверки миграции токена на pump.fun
 def check_token_migration(token_address):
@@ -44,7 +312,7 @@ def check_token_migration(token_address):
         # URL API pump.fun (заменить на реальный URL)
         api_url = f"https://api.pump.fun/tokens/{token_address}"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -55,10 +323,12 @@ def check_token_migration(token_address):
                     "above_threshold": data["migrationPercentage"] >= 98
                 }
         
+        # 404 и ответ без процента - проблема токена; 429 и 5xx - сбой API
         return {
             "success": False,
             "migration_percentage": 0,
-            "above_threshold": False
+            "above_threshold": False,
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при проверке миграции токена {token_address}: {str(e)}")
@@ -66,6 +336,8 @@ def check_token_migration(token_address):
             "success": False,
             "migration_percentage": 0,
             "above_threshold": False,
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
@@ -75,7 +347,7 @@ def check_raydium_token_migration(token_address):
         # URL API Raydium (заменить на реальный URL)
         api_url = f"https://api.raydium.io/tokens/{token_address}"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -86,10 +358,12 @@ def check_raydium_token_migration(token_address):
                     "above_threshold": data["migrationPercentage"] >= 98
                 }
         
+        # 404 и ответ без процента - проблема токена; 429 и 5xx - сбой API
         return {
             "success": False,
             "migration_percentage": 0,
-            "above_threshold": False
+            "above_threshold": False,
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при проверке миграции токена Raydium {token_address}: {str(e)}")
@@ -97,6 +371,8 @@ def check_raydium_token_migration(token_address):
             "success": False,
             "migration_percentage": 0,
             "above_threshold": False,
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
@@ -106,7 +382,7 @@ def get_new_pumpfun_tokens():
         # URL API для получения новых токенов (заменить на реальный URL)
         api_url = "https://api.pump.fun/tokens/new"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -118,13 +394,16 @@ def get_new_pumpfun_tokens():
         
         return {
             "success": False,
-            "tokens": []
+            "tokens": [],
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при получении новых токенов с pump.fun: {str(e)}")
         return {
             "success": False,
             "tokens": [],
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
@@ -134,7 +413,7 @@ def get_new_raydium_tokens():
         # URL API для получения новых токенов (заменить на реальный URL)
         api_url = "https://api.raydium.io/tokens/new"
         
-        response = requests.get(api_url)
+        response = http_client.get(api_url)
         
         if response.status_code == 200:
             data = response.json()
@@ -146,21 +425,24 @@ def get_new_raydium_tokens():
         
         return {
             "success": False,
-            "tokens": []
+            "tokens": [],
+            "upstream_error": is_upstream_status(response.status_code)
         }
     except Exception as e:
         print(f"Ошибка при получении новых токенов с Raydium: {str(e)}")
         return {
             "success": False,
             "tokens": [],
+            "upstream_error": is_upstream_error(e),
+            "local_timeout": is_local_timeout(e),
             "error": str(e)
         }
 
 # Функция для отправки транзакции SOL
-def send_sol(from_private_key, to_address, amount_sol):
+def send_sol(from_private_key, to_address, amount_sol, from_address=None, recent_blockhash=None, priority_fee=None):
     try:
-        # Создаем keypair из приватного ключа
-        keypair = Keypair.from_secret_key(b58decode(from_private_key))
+        # Получаем keypair из приватного ключа (из кэша, если известен адрес отправителя)
+        keypair = get_keypair(from_private_key, from_address)
         
         # Преобразуем SOL в lamports
         amount_lamports = int(amount_sol * 1_000_000_000)
@@ -174,22 +456,35 @@ def send_sol(from_private_key, to_address, amount_sol):
             )
         )
         
-        # Создаем транзакцию
-        transaction = Transaction().add(transfer_ix)
+        # Создаем транзакцию (плательщик комиссии указан явно: инструкции ComputeBudget идут первыми без аккаунтов)
+        transaction = Transaction(fee_payer=keypair.public_key)
+        
+        # Приоритетная комиссия из фонового окна, без запроса к RPC
+        if priority_fee is None:
+            priority_fee = PRIORITY_FEE_ENABLED
+        if priority_fee:
+            transaction.add(*compute_budget_instructions(TRANSFER_COMPUTE_UNIT_LIMIT))
         
-        # Получаем последний блокхеш
-        recent_blockhash = solana_client.get_recent_blockhash()['result']['value']['blockhash']
-        transaction.recent_blockhash = recent_blockhash
+        transaction.add(transfer_ix)
+        
+        # Берем блокхеш из фонового кэша (или переданный для пакета транзакций)
+        transaction.recent_blockhash = recent_blockhash or blockhash_provider.get()
         
         # Подписываем транзакцию
         transaction.sign(keypair)
         
-        # Отправляем транзакцию
-        response = solana_client.send_transaction(transaction)
+        # Отправляем подписанную транзакцию (повторная отправка на вторую ноду безопасна: подпись та же)
+        signature = rpc_request("sendTransaction", [
+            base64.b64encode(transaction.serialize()).decode("ascii"),
+            {"encoding": "base64"}
+        ], hedge=True)
+        
+        # Балансы отправителя и получателя изменились
+        invalidate_balances([str(keypair.public_key), to_address])
         
         return {
             "success": True,
-            "signature": response['result'],
+            "signature": signature,
             "amount_sol": amount_sol
         }
     except Exception as e:
@@ -199,6 +494,25 @@ def send_sol(from_private_key, to_address, amount_sol):
             "error": str(e)
         }
 
+# Функция для пакетной отправки SOL (все транзакции пакета используют один свежий блокхеш)
+def send_sol_batch(transfers):
+    try:
+        recent_blockhash = blockhash_provider.get()
+    except Exception as e:
+        print(f"Ошибка при получении блокхеша для пакета переводов: {str(e)}")
+        return [{"success": False, "error": str(e)} for _ in transfers]
+    
+    return [
+        send_sol(
+            transfer_data["from_private_key"],
+            transfer_data["to_address"],
+            transfer_data["amount_sol"],
+            transfer_data.get("from_address"),
+            recent_blockhash
+        )
+        for transfer_data in transfers
+    ]
+
 # Функция для покупки токена (упрощенная симуляция)
 def buy_token(wallet_private_key, token_address, amount_in_sol):
     try:
@@ -282,25 +596,123 @@ def sell_token(wallet_private_key, token_address, token_amount, purchase_price):
             "error": str(e)
         }
 
+# SPL Token Program ID
+TOKEN_PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+
+# Начало раскладки аккаунта SPL-токена (165 байт): mint (32), owner (32), amount (u64 LE)
+SPL_TOKEN_ACCOUNT_SIZE = 165
+SPL_TOKEN_ACCOUNT_LAYOUT = struct.Struct("<32s32sQ")
+
+# Смещение поля decimals в аккаунте mint (после mint_authority COption<Pubkey> и supply u64)
+MINT_DECIMALS_OFFSET = 44
+
+# Кэш decimals по mint (значение не меняется после создания токена)
+mint_decimals_cache = LRUCache(maxsize=int(os.environ.get("MINT_DECIMALS_CACHE_SIZE", 100000)))
+mint_decimals_lock = threading.Lock()
+
+# Функция для получения decimals нескольких mint (getMultipleAccounts с выборкой одного байта)
+def get_mint_decimals(mints):
+    decimals = {}
+    missing = []
+    
+    with mint_decimals_lock:
+        for mint in dict.fromkeys(mints):
+            if mint in mint_decimals_cache:
+                decimals[mint] = mint_decimals_cache[mint]
+            else:
+                missing.append(mint)
+    
+    for start in range(0, len(missing), MULTIPLE_ACCOUNTS_LIMIT):
+        chunk = missing[start:start + MULTIPLE_ACCOUNTS_LIMIT]
+        result = rpc_request("getMultipleAccounts", [
+            chunk,
+            {"encoding": "base64", "dataSlice": {"offset": MINT_DECIMALS_OFFSET, "length": 1}}
+        ])
+        
+        with mint_decimals_lock:
+            for mint, account in zip(chunk, result["value"]):
+                if account is None:
+                    continue
+                data = base64.b64decode(account["data"][0])
+                decimals[mint] = data[0]
+                mint_decimals_cache[mint] = data[0]
+    
+    return decimals
+
+# Функция для разбора ответа getTokenAccountsByOwner в кодировке jsonParsed
+def parse_token_accounts_json(accounts):
+    token_accounts = []
+    for account in accounts:
+        token_accounts.append({
+            "pubkey": account['pubkey'],
+            "account": account['account'],
+            "mint": account['account']['data']['parsed']['info']['mint'],
+            "owner": account['account']['data']['parsed']['info']['owner'],
+            "amount": int(account['account']['data']['parsed']['info']['tokenAmount']['amount']),
+            "decimals": account['account']['data']['parsed']['info']['tokenAmount']['decimals'],
+            "uiAmount": account['account']['data']['parsed']['info']['tokenAmount']['uiAmount']
+        })
+    return token_accounts
+
+# Функция для разбора аккаунтов SPL-токенов в кодировке base64 по фиксированной раскладке
+def decode_token_accounts(accounts, decimals_by_mint=None):
+    rows = []
+    unpack_from = SPL_TOKEN_ACCOUNT_LAYOUT.unpack_from
+    
+    # Адреса кодируются в base58 через solders; владелец у всех аккаунтов кошелька один и тот же
+    addresses = {}
+    def to_address(key_bytes):
+        address = addresses.get(key_bytes)
+        if address is None:
+            address = addresses[key_bytes] = str(Pubkey.from_bytes(key_bytes))
+        return address
+    
+    # Поля читаются напрямую из буфера без промежуточных срезов
+    for account in accounts:
+        data = memoryview(base64.b64decode(account['account']['data'][0]))
+        if len(data) < SPL_TOKEN_ACCOUNT_SIZE:
+            continue
+        
+        mint_bytes, owner_bytes, amount = unpack_from(data)
+        rows.append((account, to_address(mint_bytes), to_address(owner_bytes), amount))
+    
+    # Decimals хранятся в аккаунте mint, а не в аккаунте токена
+    if decimals_by_mint is None:
+        decimals_by_mint = get_mint_decimals([mint for account, mint, owner, amount in rows])
+    
+    token_accounts = []
+    for account, mint, owner, amount in rows:
+        decimals = decimals_by_mint.get(mint, 0)
+        token_accounts.append({
+            "pubkey": account['pubkey'],
+            "account": account['account'],
+            "mint": mint,
+            "owner": owner,
+            "amount": amount,
+            "decimals": decimals,
+            "uiAmount": amount / 10 ** decimals
+        })
+    
+    return token_accounts
+
 # Функция для получения всех SPL-токенов на кошельке
-def get_token_accounts(wallet_address):
+def get_token_accounts(wallet_address, raw=True):
     try:
-        response = solana_client.get_token_accounts_by_owner(
-            PublicKey(wallet_address),
-            {"programId": PublicKey("TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA")}  # SPL Token Program ID
-        )
-        
-        token_accounts = []
-        for account in response['result']['value']:
-            token_accounts.append({
-                "pubkey": account['pubkey'],
-                "account": account['account'],
-                "mint": account['account']['data']['parsed']['info']['mint'],
-                "owner": account['account']['data']['parsed']['info']['owner'],
-                "amount": int(account['account']['data']['parsed']['info']['tokenAmount']['amount']),
-                "decimals": account['account']['data']['parsed']['info']['tokenAmount']['decimals'],
-                "uiAmount": account['account']['data']['parsed']['info']['tokenAmount']['uiAmount']
-            })
+        if not raw:
+            result = rpc_request("getTokenAccountsByOwner", [
+                wallet_address,
+                {"programId": TOKEN_PROGRAM_ID},
+                {"encoding": "jsonParsed"}
+            ])
+            token_accounts = parse_token_accounts_json(result['value'])
+        else:
+            # Сырые данные аккаунтов (base64) разбираются локально без jsonParsed
+            result = rpc_request("getTokenAccountsByOwner", [
+                wallet_address,
+                {"programId": TOKEN_PROGRAM_ID},
+                {"encoding": "base64"}
+            ])
+            token_accounts = decode_token_accounts(result['value'])
         
         return {
             "success": True,
@@ -316,12 +728,27 @@ def get_token_accounts(wallet_address):
 # Экспортируем функции для использования в других модулях
 __all__ = [
     'get_wallet_balance',
+    'get_wallet_balances',
+    'invalidate_balances',
     'check_token_migration',
     'check_raydium_token_migration',
     'get_new_pumpfun_tokens',
     'get_new_raydium_tokens',
     'send_sol',
+    'send_sol_batch',
+    'rpc_request',
+    'rpc_pool',
+    'BlockhashProvider',
+    'blockhash_provider',
+    'fee_oracle',
+    'compute_budget_instructions',
     'buy_token',
     'sell_token',
-    'get_token_accounts'
+    'get_token_accounts',
+    'get_mint_decimals',
+    'parse_token_accounts_json',
+    'decode_token_accounts',
+    'get_keypair',
+    'invalidate_keypair',
+    'get_keypair_cache_stats'
 ]
\ No newline at end of file
@@ -0,0 +1,871 @@
+# storage.py - Хранилище данных моделей: MongoDB или in-memory движок с той же семантикой
+
+import copy
+import operator
+import os
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument, InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure, CollectionInvalid
+from pymongo.results import InsertOneResult, InsertManyResult, UpdateResult, DeleteResult, BulkWriteResult
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Отсутствующее поле документа (в отличие от поля со значением None)
+MISSING = object()
+
+def get_field(document, path):
+    """Значение поля по пути через точку или MISSING"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def set_field(document, path, value):
+    """Установка поля по пути через точку"""
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+def unset_field(document, path):
+    """Удаление поля по пути через точку"""
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+def sort_key(value):
+    """Ключ сравнения в порядке типов BSON: null < числа < строки < документы < массивы < ObjectId < bool < даты"""
+    if value is None or value is MISSING:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, dict):
+        return (3, tuple((key, sort_key(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (4, tuple(sort_key(item) for item in value))
+    if isinstance(value, bytes):
+        return (5, value)
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value)
+    return (10, str(value))
+
+def expression_key(value):
+    """Ключ сравнения в выражениях агрегации: отсутствующее поле меньше null"""
+    return (-1, 0) if value is MISSING else sort_key(value)
+
+COMPARISONS = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le
+}
+
+def values_equal(value, expected):
+    """Равенство в запросе: null совпадает с отсутствующим полем, массив - с любым своим элементом"""
+    if value is MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return any(values_equal(item, expected) for item in value)
+    return sort_key(value) == sort_key(expected)
+
+def is_operator_condition(condition):
+    """Условие вида {"$gt": ...} (в отличие от сравнения с вложенным документом)"""
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+def match_document(document, query):
+    """Соответствие документа фильтру запроса"""
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(match_document(document, item) for item in condition):
+                return False
+        elif key == "$or":
+            if not any(match_document(document, item) for item in condition):
+                return False
+        elif key == "$nor":
+            if any(match_document(document, item) for item in condition):
+                return False
+        elif not match_condition(get_field(document, key), condition):
+            return False
+    return True
+
+def match_condition(value, condition):
+    """Соответствие значения поля условию"""
+    if not is_operator_condition(condition):
+        return values_equal(value, condition)
+    return all(match_operator(value, name, argument) for name, argument in condition.items())
+
+def match_operator(value, name, argument):
+    """Оператор сравнения запроса"""
+    if name == "$eq":
+        return values_equal(value, argument)
+    if name == "$ne":
+        return not values_equal(value, argument)
+    if name == "$in":
+        return any(values_equal(value, item) for item in argument)
+    if name == "$nin":
+        return not any(values_equal(value, item) for item in argument)
+    if name == "$exists":
+        return (value is not MISSING) == bool(argument)
+    if name == "$not":
+        return not match_condition(value, argument)
+    if name in COMPARISONS:
+        if value is MISSING:
+            return False
+        value_key, argument_key = sort_key(value), sort_key(argument)
+        # Сравнение только в пределах одного типа, как в MongoDB
+        return value_key[0] == argument_key[0] and COMPARISONS[name](value_key, argument_key)
+    raise OperationFailure(f"Оператор запроса {name} не поддерживается in-memory хранилищем")
+
+def project(document, projection):
+    """Копия документа с учетом проекции (включающей или исключающей)"""
+    if not projection:
+        return copy.deepcopy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = projection.get("_id", 1)
+    fields = {field: value for field, value in projection.items() if field != "_id"}
+
+    if any(fields.values()):
+        result = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for path, included in fields.items():
+            value = get_field(document, path)
+            if included and value is not MISSING:
+                set_field(result, path, copy.deepcopy(value))
+        return result
+
+    result = copy.deepcopy(document)
+    for path in fields:
+        unset_field(result, path)
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+def apply_update(document, update, inserting=False):
+    """Применение операторов обновления к документу (на месте)"""
+    if not any(key.startswith("$") for key in update):
+        # Замена документа целиком с сохранением _id
+        document_id = document.get("_id")
+        document.clear()
+        document.update(copy.deepcopy(update))
+        if document_id is not None:
+            document["_id"] = document_id
+        return
+
+    for name, fields in update.items():
+        if name == "$set" or (name == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                set_field(document, path, copy.deepcopy(value))
+        elif name == "$setOnInsert":
+            continue
+        elif name == "$inc":
+            for path, value in fields.items():
+                current = get_field(document, path)
+                set_field(document, path, (0 if current is MISSING else current) + value)
+        elif name == "$unset":
+            for path in fields:
+                unset_field(document, path)
+        elif name == "$push":
+            for path, value in fields.items():
+                current = get_field(document, path)
+                set_field(document, path, ([] if current is MISSING else current) + [copy.deepcopy(value)])
+        else:
+            raise OperationFailure(f"Оператор обновления {name} не поддерживается in-memory хранилищем")
+
+def upsert_document(query):
+    """Начальный документ для upsert: поля фильтра с условием равенства"""
+    document = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if is_operator_condition(condition):
+            if "$eq" in condition:
+                set_field(document, key, copy.deepcopy(condition["$eq"]))
+        else:
+            set_field(document, key, copy.deepcopy(condition))
+    return document
+
+# Длительность единиц $dateTrunc в секундах; интервалы отсчитываются от 2000-01-01, как в MongoDB
+DATE_UNITS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400
+}
+DATE_TRUNC_REFERENCE = datetime(2000, 1, 1)
+
+def evaluate(expression, document):
+    """Вычисление выражения агрегации для документа"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        if expression == "$$ROOT":
+            return document
+        return get_field(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        return {key: evaluate(value, document) for key, value in expression.items()}
+
+    name, argument = next(iter(expression.items()))
+    if name == "$literal":
+        return argument
+    if name == "$cond":
+        if isinstance(argument, dict):
+            argument = [argument["if"], argument["then"], argument["else"]]
+        condition, then, otherwise = argument
+        return evaluate(then if truthy(evaluate(condition, document)) else otherwise, document)
+    if name == "$dateTrunc":
+        date = evaluate(argument["date"], document)
+        if not isinstance(date, datetime):
+            return None
+        size = DATE_UNITS[argument["unit"]] * argument.get("binSize", 1)
+        offset = (date - DATE_TRUNC_REFERENCE).total_seconds() % size
+        return date.replace(microsecond=0) - timedelta(seconds=int(offset))
+
+    values = [evaluate(item, document) for item in (argument if isinstance(argument, list) else [argument])]
+    if name == "$and":
+        return all(truthy(value) for value in values)
+    if name == "$or":
+        return any(truthy(value) for value in values)
+    if name == "$not":
+        return not truthy(values[0])
+    if name == "$eq":
+        return expression_key(values[0]) == expression_key(values[1])
+    if name == "$ne":
+        return expression_key(values[0]) != expression_key(values[1])
+    if name in COMPARISONS:
+        return COMPARISONS[name](expression_key(values[0]), expression_key(values[1]))
+    if name == "$ifNull":
+        return next((value for value in values[:-1] if value is not None and value is not MISSING), values[-1])
+    if name in ("$add", "$subtract", "$multiply", "$divide"):
+        if any(value is None or value is MISSING for value in values):
+            return None
+        if name == "$add":
+            return sum(values[1:], values[0])
+        if name == "$subtract":
+            difference = values[0] - values[1]
+            # Разность дат в MongoDB - миллисекунды
+            return difference.total_seconds() * 1000 if isinstance(difference, timedelta) else difference
+        if name == "$multiply":
+            result = 1
+            for value in values:
+                result *= value
+            return result
+        return values[0] / values[1]
+    raise OperationFailure(f"Оператор выражения {name} не поддерживается in-memory хранилищем")
+
+def truthy(value):
+    """Истинность значения в выражениях агрегации"""
+    return value is not MISSING and value is not None and value is not False and value != 0
+
+ACCUMULATORS = ("$sum", "$avg", "$min", "$max", "$first", "$last", "$push", "$addToSet", "$count")
+
+def accumulate(name, values):
+    """Значение аккумулятора $group по вычисленным значениям группы"""
+    present = [value for value in values if value is not MISSING and value is not None]
+    numbers = [value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if name == "$sum":
+        return sum(numbers)
+    if name == "$count":
+        return len(values)
+    if name == "$avg":
+        return sum(numbers) / len(numbers) if numbers else None
+    if name == "$min":
+        return min(present, key=sort_key) if present else None
+    if name == "$max":
+        return max(present, key=sort_key) if present else None
+    if name == "$first":
+        return values[0] if values and values[0] is not MISSING else None
+    if name == "$last":
+        return values[-1] if values and values[-1] is not MISSING else None
+    if name == "$push":
+        return present
+    unique = {}
+    for value in present:
+        unique.setdefault(sort_key(value), value)
+    return list(unique.values())
+
+class MemoryCursor:
+    """Курсор in-memory коллекции: фильтр, сортировка, пропуск и лимит применяются при первом чтении"""
+
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self.sort_fields = None
+        self.skip_count = 0
+        self.limit_count = 0
+        self.iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        """Сортировка по полю или списку (поле, направление)"""
+        if isinstance(key_or_list, str):
+            self.sort_fields = [(key_or_list, direction or 1)]
+        else:
+            self.sort_fields = list(key_or_list.items() if isinstance(key_or_list, dict) else key_or_list)
+        return self
+
+    def skip(self, count):
+        self.skip_count = count
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.iterator is None:
+            self.iterator = iter(self.collection._select(self.query, self.projection, self.sort_fields,
+                                                         self.skip_count, self.limit_count))
+        return next(self.iterator)
+
+    def close(self):
+        self.iterator = iter(())
+
+    def explain(self):
+        """План в формате explain MongoDB (поиск по индексу или полный просмотр)"""
+        return {"queryPlanner": {"winningPlan": self.collection._plan(self.query)}}
+
+class MemoryCollection:
+    """Коллекция в памяти: документы по _id и хеш-индексы по первому полю каждого индекса.
+    Уникальные индексы соблюдаются; сроки хранения (TTL) не применяются"""
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.created = False
+        self.options = {}
+
+        # Документы по ключу _id (sort_key: _id может быть составным документом) в порядке вставки
+        self.documents = {}
+
+        # Описания индексов: имя -> {"key": [(поле, направление)], "unique": ..., ...}
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+
+        # Хеш-индексы: первое поле индекса -> ключ значения -> {ключ _id: None}
+        self.lookups = {}
+
+        # Уникальные индексы: имя -> ключ значений полей -> ключ _id
+        self.unique_keys = {}
+
+        self.lock = threading.RLock()
+
+    def _document_key(self, document, fields):
+        return tuple(sort_key(get_field(document, field)) for field in fields)
+
+    def _rebuild_indexes(self):
+        """Перестроение хеш-индексов и проверок уникальности по описаниям индексов"""
+        self.lookups = {
+            spec["key"][0][0]: {}
+            for name, spec in self.indexes.items()
+            if name != "_id_"
+        }
+        self.unique_keys = {}
+        for name, spec in self.indexes.items():
+            if name != "_id_" and spec.get("unique"):
+                fields = [field for field, _ in spec["key"]]
+                keys = self.unique_keys[name] = {}
+                for document in self.documents.values():
+                    key = self._document_key(document, fields)
+                    if key in keys:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+                    keys[key] = sort_key(document["_id"])
+        for document in self.documents.values():
+            self._index_lookups(document)
+
+    def _index_lookups(self, document):
+        for field, values in self.lookups.items():
+            values.setdefault(sort_key(get_field(document, field)), {})[sort_key(document["_id"])] = None
+
+    def _unindex(self, document):
+        for field, values in self.lookups.items():
+            ids = values.get(sort_key(get_field(document, field)))
+            if ids is not None:
+                ids.pop(sort_key(document["_id"]), None)
+        for name, keys in self.unique_keys.items():
+            fields = [field for field, _ in self.indexes[name]["key"]]
+            keys.pop(self._document_key(document, fields), None)
+
+    def _check_unique(self, document, replacing_id=None):
+        """Проверка уникальных индексов для нового или измененного документа (replacing_id - ключ _id заменяемого)"""
+        document_id = sort_key(document["_id"])
+        if document_id in self.documents and document_id != replacing_id:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        for name, keys in self.unique_keys.items():
+            fields = [field for field, _ in self.indexes[name]["key"]]
+            owner = keys.get(self._document_key(document, fields))
+            if owner is not None and owner != replacing_id:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}")
+
+    def _store(self, document, replacing=None):
+        """Запись документа с обновлением индексов (вызывается под блокировкой)"""
+        self._check_unique(document, sort_key(replacing["_id"]) if replacing else None)
+        if replacing is not None:
+            self._unindex(replacing)
+        self.documents[sort_key(document["_id"])] = document
+        self._index_lookups(document)
+        for name, keys in self.unique_keys.items():
+            fields = [field for field, _ in self.indexes[name]["key"]]
+            keys[self._document_key(document, fields)] = sort_key(document["_id"])
+        self.created = True
+
+    def _candidate_ids(self, query):
+        """Ключи _id документов, выбранных по индексу, или None (нужен полный просмотр)"""
+        condition = query.get("_id", MISSING)
+        if condition is not MISSING and not is_operator_condition(condition):
+            return [sort_key(condition)] if sort_key(condition) in self.documents else []
+
+        for field, condition in query.items():
+            values = self.lookups.get(field)
+            if values is None:
+                continue
+            if not is_operator_condition(condition) and not isinstance(condition, (list, dict)):
+                return list(values.get(sort_key(condition), ()))
+            if is_operator_condition(condition) and list(condition) == ["$in"]:
+                ids = {}
+                for item in condition["$in"]:
+                    ids.update(values.get(sort_key(item), {}))
+                return list(ids)
+        return None
+
+    def _plan(self, query):
+        """Стадия плана выполнения для фильтра"""
+        if self._candidate_ids(query) is None:
+            return {"stage": "COLLSCAN"}
+        return {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+
+    def _matching(self, query):
+        """Хранимые документы, соответствующие фильтру (вызывается под блокировкой)"""
+        query = query or {}
+        ids = self._candidate_ids(query)
+        documents = self.documents.values() if ids is None else (self.documents[i] for i in ids if i in self.documents)
+        return [document for document in documents if match_document(document, query)]
+
+    def _select(self, query, projection=None, sort=None, skip=0, limit=0):
+        """Выборка копий документов с сортировкой и лимитом"""
+        with self.lock:
+            documents = self._matching(query)
+            for field, direction in reversed(sort or []):
+                documents.sort(key=lambda document: sort_key(get_field(document, field)), reverse=direction < 0)
+            documents = documents[skip:skip + limit] if limit else documents[skip:]
+            return [project(document, projection) for document in documents]
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        cursor = MemoryCursor(self, filter, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        documents = self._select(filter, projection, sort, limit=1)
+        return documents[0] if documents else None
+
+    def count_documents(self, filter):
+        with self.lock:
+            return len(self._matching(filter))
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def insert_one(self, document):
+        with self.lock:
+            document.setdefault("_id", ObjectId())
+            self._store(copy.deepcopy(document))
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents, ordered=True):
+        inserted_ids = []
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self.insert_one(document).inserted_id)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted_ids)})
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, filter, update, upsert=False, multi=False, sort=None):
+        """Обновление документов; возвращает (найдено, изменено, _id вставленного, прежний документ, новый документ)"""
+        with self.lock:
+            documents = self._matching(filter)
+            for field, direction in reversed(sort or []):
+                documents.sort(key=lambda document: sort_key(get_field(document, field)), reverse=direction < 0)
+            if not multi:
+                documents = documents[:1]
+
+            if not documents:
+                if not upsert:
+                    return 0, 0, None, None, None
+                document = upsert_document(filter)
+                apply_update(document, update, inserting=True)
+                document.setdefault("_id", ObjectId())
+                self._store(document)
+                return 0, 0, document["_id"], None, document
+
+            modified = 0
+            for previous in documents:
+                document = copy.deepcopy(previous)
+                apply_update(document, update)
+                if document != previous:
+                    self._store(document, replacing=previous)
+                    modified += 1
+            return len(documents), modified, None, previous, self.documents[sort_key(previous["_id"])]
+
+    @staticmethod
+    def _update_result(matched, modified, upserted_id):
+        raw_result = {"n": matched or (1 if upserted_id is not None else 0), "nModified": modified, "updatedExisting": bool(matched)}
+        if upserted_id is not None:
+            raw_result["upserted"] = upserted_id
+        return UpdateResult(raw_result, True)
+
+    def update_one(self, filter, update, upsert=False):
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert)
+        return self._update_result(matched, modified, upserted_id)
+
+    def update_many(self, filter, update, upsert=False):
+        matched, modified, upserted_id, _, _ = self._update(filter, update, upsert, multi=True)
+        return self._update_result(matched, modified, upserted_id)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        return self.update_one(filter, replacement, upsert)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE):
+        _, _, _, previous, document = self._update(filter, update, upsert, sort=sort)
+        result = document if return_document == ReturnDocument.AFTER else previous
+        return None if result is None else project(result, projection)
+
+    def _delete(self, filter, multi):
+        with self.lock:
+            documents = self._matching(filter)
+            if not multi:
+                documents = documents[:1]
+            for document in documents:
+                self._unindex(document)
+                del self.documents[sort_key(document["_id"])]
+            return DeleteResult({"n": len(documents)}, True)
+
+    def delete_one(self, filter):
+        return self._delete(filter, False)
+
+    def delete_many(self, filter):
+        return self._delete(filter, True)
+
+    def bulk_write(self, requests, ordered=True):
+        """Пакетная запись операций pymongo (InsertOne, UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany)"""
+        result = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                  "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+
+        for index, request in enumerate(requests):
+            try:
+                # Параметры операций pymongo не имеют публичных атрибутов
+                if isinstance(request, InsertOne):
+                    self.insert_one(request._doc)
+                    result["nInserted"] += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete(request._filter, isinstance(request, DeleteMany)).deleted_count
+                    continue
+                if not isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raise OperationFailure(f"Операция {type(request).__name__} не поддерживается in-memory хранилищем")
+
+                matched, modified, upserted_id, _, _ = self._update(
+                    request._filter, request._doc, bool(request._upsert), multi=isinstance(request, UpdateMany)
+                )
+                result["nMatched"] += matched
+                result["nModified"] += modified
+                if upserted_id is not None:
+                    result["nUpserted"] += 1
+                    result["upserted"].append({"index": index, "_id": upserted_id})
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def aggregate(self, pipeline):
+        """Конвейер агрегации: $match, $sort, $skip, $limit, $project, $set/$addFields, $group, $count, $merge"""
+        with self.lock:
+            first = pipeline[0] if pipeline else {}
+            documents = self._matching(first["$match"]) if "$match" in first else list(self.documents.values())
+            documents = [copy.deepcopy(document) for document in documents]
+
+        for stage in pipeline[1:] if "$match" in first else pipeline:
+            name, argument = next(iter(stage.items()))
+            if name == "$match":
+                documents = [document for document in documents if match_document(document, argument)]
+            elif name == "$sort":
+                for field, direction in reversed(list(argument.items())):
+                    documents.sort(key=lambda document: sort_key(get_field(document, field)), reverse=direction < 0)
+            elif name == "$skip":
+                documents = documents[argument:]
+            elif name == "$limit":
+                documents = documents[:argument]
+            elif name in ("$set", "$addFields"):
+                for document in documents:
+                    for path, expression in argument.items():
+                        set_field(document, path, evaluate(expression, document))
+            elif name == "$project":
+                documents = [self._project_stage(document, argument) for document in documents]
+            elif name == "$group":
+                documents = self._group(documents, argument)
+            elif name == "$count":
+                documents = [{argument: len(documents)}]
+            elif name == "$merge":
+                self._merge(documents, argument)
+                documents = []
+            else:
+                raise OperationFailure(f"Стадия {name} не поддерживается in-memory хранилищем")
+
+        return iter(documents)
+
+    @staticmethod
+    def _project_stage(document, argument):
+        """Стадия $project: включение, исключение и вычисляемые поля"""
+        computed = {field: value for field, value in argument.items() if not isinstance(value, (bool, int))}
+        result = project(document, {field: value for field, value in argument.items() if field not in computed})
+        for path, expression in computed.items():
+            set_field(result, path, evaluate(expression, document))
+        return result
+
+    @staticmethod
+    def _group(documents, argument):
+        """Стадия $group"""
+        groups = {}
+        for document in documents:
+            group_id = evaluate(argument["_id"], document)
+            group_id = None if group_id is MISSING else group_id
+            groups.setdefault(sort_key(group_id), (group_id, []))[1].append(document)
+
+        results = []
+        for group_id, members in groups.values():
+            result = {"_id": group_id}
+            for field, accumulator in argument.items():
+                if field == "_id":
+                    continue
+                name, expression = next(iter(accumulator.items()))
+                if name not in ACCUMULATORS:
+                    raise OperationFailure(f"Аккумулятор {name} не поддерживается in-memory хранилищем")
+                result[field] = accumulate(name, [evaluate(expression, member) for member in members])
+            results.append(result)
+        return results
+
+    def _merge(self, documents, argument):
+        """Стадия $merge: запись результата в коллекцию по _id"""
+        if isinstance(argument, str):
+            argument = {"into": argument}
+        into = argument["into"] if isinstance(argument["into"], str) else argument["into"]["coll"]
+        target = self.database[into]
+        when_matched = argument.get("whenMatched", "merge")
+        when_not_matched = argument.get("whenNotMatched", "insert")
+
+        if argument.get("on", "_id") != "_id":
+            raise OperationFailure("$merge in-memory хранилища поддерживает только on: _id")
+
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            if target.find_one({"_id": document["_id"]}, {"_id": 1}) is not None:
+                if when_matched == "replace":
+                    target.replace_one({"_id": document["_id"]}, document)
+                elif when_matched == "merge":
+                    target.update_one({"_id": document["_id"]}, {"$set": document})
+                elif when_matched == "fail":
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {into} index: _id_")
+            elif when_not_matched == "insert":
+                target.insert_one(document)
+            elif when_not_matched == "fail":
+                raise OperationFailure(f"$merge: документ {document['_id']} не найден в {into}")
+
+    def create_index(self, keys, **kwargs):
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = kwargs.pop("name", None) or "_".join(f"{field}_{direction}" for field, direction in keys)
+        with self.lock:
+            previous = self.indexes.get(name)
+            self.indexes[name] = dict(kwargs, key=list(keys))
+            try:
+                self._rebuild_indexes()
+            except DuplicateKeyError:
+                if previous is None:
+                    del self.indexes[name]
+                else:
+                    self.indexes[name] = previous
+                self._rebuild_indexes()
+                raise
+            self.created = True
+        return name
+
+    def create_indexes(self, indexes):
+        names = []
+        for index in indexes:
+            spec = dict(index.document)
+            names.append(self.create_index(list(spec.pop("key").items()), **spec))
+        return names
+
+    def index_information(self):
+        with self.lock:
+            return copy.deepcopy(self.indexes)
+
+    def drop_index(self, name):
+        with self.lock:
+            if name == "_id_" or name not in self.indexes:
+                raise OperationFailure(f"index not found with name [{name}]")
+            del self.indexes[name]
+            self._rebuild_indexes()
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+    def _reset(self):
+        """Очистка коллекции вместе с индексами (объект коллекции остается действительным)"""
+        with self.lock:
+            self.documents = {}
+            self.indexes = {"_id_": {"key": [("_id", 1)]}}
+            self.options = {}
+            self.created = False
+            self._rebuild_indexes()
+
+    def watch(self, *args, **kwargs):
+        """Change stream в памяти недоступен (как без replica set): вызывающий код переходит на опрос"""
+        raise OperationFailure("Change streams не поддерживаются in-memory хранилищем")
+
+class MemoryStorage:
+    """In-memory хранилище с интерфейсом базы данных MongoDB для тестов и нагрузочных прогонов на одной машине"""
+
+    def __init__(self, database_name="solana_bot_db"):
+        self.name = database_name
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                collection = self.collections[name] = MemoryCollection(self, name)
+            return collection
+
+    def get_collection(self, name):
+        return self[name]
+
+    def list_collection_names(self):
+        with self.lock:
+            return [name for name, collection in self.collections.items() if collection.created]
+
+    def create_collection(self, name, **options):
+        """Создание коллекции; параметры (в том числе timeseries и expireAfterSeconds) сохраняются, но не применяются"""
+        collection = self[name]
+        with collection.lock:
+            if collection.created:
+                raise CollectionInvalid(f"collection {name} already exists")
+            collection.created = True
+            collection.options = options
+        return collection
+
+    def drop_collection(self, name):
+        # Коллекция очищается на месте: модели хранят ссылки на объекты коллекций
+        collection = self.collections.get(name)
+        if collection is not None:
+            collection._reset()
+
+    def command(self, command, value=None, **kwargs):
+        if command == "ping":
+            return {"ok": 1.0}
+        if command == "collMod":
+            self[value].options.update(kwargs)
+            return {"ok": 1.0}
+        raise OperationFailure(f"Команда {command} не поддерживается in-memory хранилищем")
+
+class LazyCollection:
+    """Коллекция MongoDB, подключение для которой создается при первом запросе"""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.collection = None
+
+    def __getattr__(self, attribute):
+        if self.collection is None:
+            self.collection = self.storage.database[self.name]
+        return getattr(self.collection, attribute)
+
+class MongoStorage:
+    """Хранилище MongoDB: клиент создается при первом обращении к данным, а не при импорте моделей"""
+
+    def __init__(self, uri, database_name="solana_bot_db"):
+        self.uri = uri
+        self.name = database_name
+        self.client = None
+        self.connected_database = None
+        self.lock = threading.Lock()
+
+    @property
+    def database(self):
+        """База данных MongoDB (подключение при первом обращении)"""
+        if self.connected_database is None:
+            with self.lock:
+                if self.connected_database is None:
+                    self.client = MongoClient(self.uri)
+                    self.connected_database = self.client[self.name]
+        return self.connected_database
+
+    def __getitem__(self, name):
+        return LazyCollection(self, name)
+
+    def get_collection(self, name):
+        return self[name]
+
+    def __getattr__(self, attribute):
+        # list_collection_names, create_collection, command и другие методы базы данных
+        return getattr(self.database, attribute)
+
+def create_storage(backend=None, uri=None, database_name="solana_bot_db"):
+    """Хранилище по имени движка: mongo (по умолчанию) или memory"""
+    backend = (backend or "mongo").lower()
+    if backend == "memory":
+        return MemoryStorage(database_name)
+    if backend == "mongo":
+        return MongoStorage(uri or os.environ.get("MONGODB_URI", "mongodb://localhost:27017/"), database_name)
+    raise ValueError(f"Неизвестное хранилище: {backend}")
+
+# Общее хранилище моделей и API
+storage = create_storage(os.environ.get("STORAGE_BACKEND"))
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'MongoStorage',
+    'MemoryStorage',
+    'MemoryCollection',
+    'MemoryCursor',
+    'LazyCollection',
+    'create_storage',
+    'storage'
+]
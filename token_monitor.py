@@ -1,14 +1,25 @@
 # token_monitor.py - Сервис для мониторинга токенов
 
 import time
+import queue
+import functools
 import threading
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
-from models import User, Token, Transaction
+from models import Token, Transaction
 import solana_service
 import telegram_service
+from migration_checker import MigrationChecker
+from poll_scheduler import PollScheduler
+from token_registry import TokenRegistry
+from token_stream import TokenStream
+from buy_fanout import BuyFanout
+from position_scheduler import position_scheduler
+from user_cache import active_user_cache
+from circuit_breaker import CircuitBreaker, NegativeCache
+from confirmation_tracker import confirmation_tracker, is_real_signature
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -18,7 +29,45 @@ MIGRATION_THRESHOLD = int(os.environ.get("MIGRATION_THRESHOLD", 98))
 TARGET_PROFIT = int(os.environ.get("TARGET_PROFIT", 10))
 PURCHASE_AMOUNT_SOL = float(os.environ.get("PURCHASE_AMOUNT_SOL", 0.05))
 MAX_HOLDING_TIME = int(os.environ.get("MAX_HOLDING_TIME", 3600))
+SELL_DELAY = float(os.environ.get("SELL_DELAY", 60))
 CHECK_INTERVAL = int(os.environ.get("CHECK_INTERVAL", 5))
+CHECK_CONCURRENCY = int(os.environ.get("CHECK_CONCURRENCY", 32))
+CHECK_CYCLE_DEADLINE = float(os.environ.get("CHECK_CYCLE_DEADLINE", 10))
+POLL_MIN_INTERVAL = float(os.environ.get("POLL_MIN_INTERVAL", 0.5))
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", 300))
+POLL_NEAR_MARGIN = float(os.environ.get("POLL_NEAR_MARGIN", 5))
+REGISTRY_MAX_SIZE = int(os.environ.get("REGISTRY_MAX_SIZE", 10000))
+TOKEN_TTL = int(os.environ.get("TOKEN_TTL", 86400))
+TOKEN_INACTIVITY_TIMEOUT = int(os.environ.get("TOKEN_INACTIVITY_TIMEOUT", 3600))
+TERMINAL_TOKEN_TTL = int(os.environ.get("TERMINAL_TOKEN_TTL", 86400))
+BUY_CONCURRENCY = int(os.environ.get("BUY_CONCURRENCY", 64))
+BUY_POST_WORKERS = int(os.environ.get("BUY_POST_WORKERS", 8))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 20))
+BREAKER_RECOVERY_TIMEOUT = float(os.environ.get("BREAKER_RECOVERY_TIMEOUT", 30))
+NEGATIVE_CACHE_BASE_DELAY = float(os.environ.get("NEGATIVE_CACHE_BASE_DELAY", 10))
+NEGATIVE_CACHE_MAX_DELAY = float(os.environ.get("NEGATIVE_CACHE_MAX_DELAY", 1800))
+
+# Адреса SSE-потоков новых токенов (пустое значение - только опрос /tokens/new)
+TOKEN_STREAM_URLS = {
+    "pump.fun": os.environ.get("PUMPFUN_STREAM_URL", ""),
+    "raydium": os.environ.get("RAYDIUM_STREAM_URL", "")
+}
+
+# Источники новых токенов для опроса
+NEW_TOKEN_SOURCES = [
+    ("pump.fun", solana_service.get_new_pumpfun_tokens),
+    ("raydium", solana_service.get_new_raydium_tokens)
+]
+
+# Пулы для параллельной покупки токена всем пользователям
+buy_fanout = BuyFanout(BUY_CONCURRENCY, BUY_POST_WORKERS)
+
+# Автоматы отключения API платформ и отрицательный кэш токенов, проверка которых не удается
+breakers = {
+    platform: CircuitBreaker(platform, BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT)
+    for platform in ("pump.fun", "raydium")
+}
+negative_cache = NegativeCache(NEGATIVE_CACHE_BASE_DELAY, NEGATIVE_CACHE_MAX_DELAY)
 
 # Глобальная переменная для хранения запущенного потока мониторинга
 monitoring_thread = None
@@ -27,40 +76,10 @@ stop_monitoring = False
 def buy_token_for_user(user, token_address, token_name, token_symbol, platform):
     """Функция для покупки токена пользователем"""
     try:
-        # Получаем данные кошелька
-        wallet_private_key = user["wallet_private_key"]
-        
-        # Покупаем токен (в реальности это будет вызов к solana_service.buy_token)
-        purchase_result = solana_service.buy_token(wallet_private_key, token_address, PURCHASE_AMOUNT_SOL)
+        purchase_result = execute_buy(user, token_address)
         
         if purchase_result["success"]:
-            # Создаем запись о транзакции
-            transaction_id = Transaction.create_purchase(
-                user["_id"],
-                token_address,
-                token_name,
-                token_symbol,
-                purchase_result["token_price"],
-                purchase_result["token_amount"],
-                PURCHASE_AMOUNT_SOL
-            )
-            
-            # Отправляем уведомление в Telegram
-            if "telegram_chat_id" in user and user["telegram_chat_id"]:
-                telegram_service.notify_token_purchase(
-                    user["telegram_chat_id"],
-                    token_name,
-                    round(purchase_result["token_amount"], 2),
-                    PURCHASE_AMOUNT_SOL,
-                    user.get("language", "ru")
-                )
-            
-            print(f"Токен {token_name} куплен для пользователя {user['username']}")
-            
-            # Запланируем продажу токена через некоторое время
-            # В реальности нужна проверка цены в реальном времени
-            threading.Timer(60, sell_token_for_user, args=[user, token_address, purchase_result["token_amount"], purchase_result["token_price"]]).start()
-            
+            record_purchase(user, purchase_result, token_address, token_name, token_symbol)
             return True
         
         return False
@@ -69,6 +88,73 @@ def buy_token_for_user(user, token_address, token_name, token_symbol, platform):
         print(f"Ошибка при покупке токена {token_address} для пользователя {user['username']}: {str(e)}")
         return False
 
+def execute_buy(user, token_address):
+    """Сама покупка токена (критический путь, без записи в БД и уведомлений)"""
+    # Получаем данные кошелька
+    wallet_private_key = user["wallet_private_key"]
+    
+    # Покупаем токен (в реальности это будет вызов к solana_service.buy_token)
+    return solana_service.buy_token(wallet_private_key, token_address, PURCHASE_AMOUNT_SOL)
+
+def record_purchase(user, purchase_result, token_address, token_name, token_symbol):
+    """Запись покупки, уведомление пользователя и планирование продажи"""
+    # Реальные подписи ждут подтверждения, симулированные не отслеживаются
+    signature = purchase_result.get("transaction_signature")
+    tracked = is_real_signature(signature)
+    
+    # Создаем запись о транзакции
+    transaction_id = Transaction.create_purchase(
+        user["_id"],
+        token_address,
+        token_name,
+        token_symbol,
+        purchase_result["token_price"],
+        purchase_result["token_amount"],
+        PURCHASE_AMOUNT_SOL,
+        signature,
+        "pending" if tracked else None
+    )
+    
+    # Отправляем уведомление в Telegram
+    if "telegram_chat_id" in user and user["telegram_chat_id"]:
+        telegram_service.notify_token_purchase(
+            user["telegram_chat_id"],
+            token_name,
+            round(purchase_result["token_amount"], 2),
+            PURCHASE_AMOUNT_SOL,
+            user.get("language", "ru")
+        )
+    
+    print(f"Токен {token_name} куплен для пользователя {user['username']}")
+    
+    # Запланируем продажу токена через некоторое время
+    # В реальности нужна проверка цены в реальном времени
+    sell = functools.partial(sell_token_for_user, user, token_address, purchase_result["token_amount"], purchase_result["token_price"])
+    
+    # Реальная покупка продается только после подтверждения: иначе продажа могла бы пройти раньше,
+    # чем выяснится, что покупка не состоялась
+    if tracked:
+        confirmation_tracker.track(
+            signature,
+            functools.partial(on_purchase_confirmation, user, transaction_id, token_name, sell)
+        )
+    else:
+        position_scheduler.schedule(SELL_DELAY, sell)
+    
+    return transaction_id
+
+def on_purchase_confirmation(user, transaction_id, token_name, sell, signature, status, time_to_confirm, error):
+    """Результат подтверждения покупки: обновление записи и планирование продажи (только для подтвержденной)"""
+    Transaction.update_confirmation(transaction_id, status, time_to_confirm, error)
+    
+    if status == "confirmed":
+        # Время ожидания подтверждения засчитывается в срок до продажи
+        position_scheduler.schedule(max(0, SELL_DELAY - time_to_confirm), sell)
+        print(f"Покупка токена {token_name} для пользователя {user['username']} подтверждена за {time_to_confirm:.1f} с")
+        return
+    
+    print(f"Покупка токена {token_name} для пользователя {user['username']} не подтверждена ({status}): {error}")
+
 def sell_token_for_user(user, token_address, token_amount, purchase_price):
     """Функция для продажи токена пользователем"""
     try:
@@ -114,138 +200,311 @@ def sell_token_for_user(user, token_address, token_amount, purchase_price):
         print(f"Ошибка при продаже токена {token_address} для пользователя {user['username']}: {str(e)}")
         return False
 
+def check_migration(token_address, platform):
+    """Проверка миграции токена в зависимости от платформы"""
+    if platform == "pump.fun":
+        result = solana_service.check_token_migration(token_address)
+    elif platform == "raydium":
+        result = solana_service.check_raydium_token_migration(token_address)
+    else:
+        return None
+    
+    # Учитываем ответ в автомате платформы: сбоем считаются только ошибки самого API.
+    # Таймаут на нашей стороне (бюджет цикла, лимит запросов) ничего не говорит о состоянии API
+    breaker = breakers.get(platform)
+    if breaker is not None and not result.get("local_timeout"):
+        if result["success"] or not result.get("upstream_error"):
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+    
+    return result
+
+def schedule_failed_check(scheduler, token_address, migration_result):
+    """Повторная проверка после неудачи: сбой API или таймаут на нашей стороне - в обычном режиме,
+    сбой токена - с растущей задержкой"""
+    if migration_result and (migration_result.get("upstream_error") or migration_result.get("local_timeout")):
+        scheduler.retry(token_address)
+        return
+    
+    delay = negative_cache.record_failure(token_address)
+    scheduler.retry(token_address, max(delay, scheduler.base_interval))
+
+def process_migration_result(tracked_tokens, token_address, migration_result):
+    """Обработка результата проверки миграции: обновление процента в реестре и БД"""
+    token_info = tracked_tokens.get(token_address)
+    
+    if token_info is None or not migration_result or not migration_result["success"]:
+        return
+    
+    # Обновляем процент миграции
+    tracked_tokens.touch(token_address, migration_result["migration_percentage"])
+    
+    # Обновляем в БД
+    Token.update_migration_percentage(token_address, migration_result["migration_percentage"])
+    
+    print(f"Токен {token_info['name']} ({token_info['symbol']}): миграция {migration_result['migration_percentage']}%")
+
+def buy_crossed_tokens(tracked_tokens):
+    """Покупка токенов, процент миграции которых достиг порога, для всех активных пользователей"""
+    # Одно векторное сравнение колонки процентов вместо проверки каждого токена
+    crossed_tokens = tracked_tokens.crossed_threshold(MIGRATION_THRESHOLD)
+    
+    if not crossed_tokens:
+        return crossed_tokens
+    
+    # Получаем всех активных пользователей из кэша
+    active_users = active_user_cache.get_all()
+    
+    for token_address in crossed_tokens:
+        token_info = tracked_tokens.get(token_address)
+        token_name = token_info["name"]
+        token_symbol = token_info["symbol"]
+        
+        token_info["status"] = "buying"
+        
+        # Обновляем статус в БД
+        Token.update_status(token_address, "buying")
+        
+        # Покупаем токен для всех пользователей одновременно, запись и уведомления идут в фоне
+        buy_fanout.run(
+            active_users,
+            functools.partial(execute_buy, token_address=token_address),
+            functools.partial(record_purchase, token_address=token_address, token_name=token_name, token_symbol=token_symbol)
+        )
+        
+        # Меняем статус токена на "bought" и убираем его из живых
+        token_info["status"] = "bought"
+        Token.update_status(token_address, "bought")
+        tracked_tokens.mark_terminal(token_address, "bought")
+    
+    return crossed_tokens
+
+def add_new_tokens(tracked_tokens, scheduler, tokens, platform):
+    """Добавление новых токенов из ленты платформы в БД и в отслеживаемые"""
+    # Убираем уже отслеживаемые токены и повторы внутри страницы ленты
+    new_tokens = {}
+    for token in tokens:
+        if token["address"] not in tracked_tokens and token["address"] not in new_tokens:
+            new_tokens[token["address"]] = token
+    
+    if not new_tokens:
+        return 0
+    
+    # Добавляем отсутствующие токены в БД одним пакетом
+    db_started = time.perf_counter()
+    created = Token.bulk_create_missing(list(new_tokens.values()), platform)
+    
+    # $setOnInsert не меняет статус существующих записей: токены, уже купленные или завершенные
+    # (например, до перезапуска или после вытеснения из реестра), повторно не отслеживаются
+    finished = Token.get_finished_statuses(new_tokens) if created < len(new_tokens) else {}
+    db_time = time.perf_counter() - db_started
+    
+    for token_address, status in finished.items():
+        tracked_tokens.mark_terminal(token_address, status)
+        del new_tokens[token_address]
+    
+    for token in new_tokens.values():
+        # Добавляем в отслеживаемые
+        tracked_tokens.add(token["address"], {
+            "name": token["name"],
+            "symbol": token["symbol"],
+            "platform": platform,
+            "last_migration_percentage": 0,
+            "time_added": datetime.now(),
+            "status": "tracking"
+        })
+        
+        scheduler.add(token["address"])
+        
+        print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
+    
+    # Токены, вытесненные из переполненного реестра, больше не проверяются и не считаются отслеживаемыми
+    evicted_tokens = tracked_tokens.pop_capacity_evicted()
+    if evicted_tokens:
+        for token_address in evicted_tokens:
+            scheduler.remove(token_address)
+        Token.bulk_update_status(evicted_tokens, "evicted")
+        print(f"Вытеснено из переполненного реестра: {len(evicted_tokens)}, статистика реестра: {tracked_tokens.stats()}")
+    
+    print(f"Новых токенов {platform}: {len(new_tokens)} (создано в БД: {created}), запись в БД: {db_time * 1000:.1f} мс")
+    
+    return len(new_tokens)
+
 def monitor_tokens():
     """Основная функция для мониторинга токенов"""
     global stop_monitoring
     
     print("Запуск мониторинга токенов...")
     
-    # Словарь для отслеживания токенов
-    tracked_tokens = {}
+    # Окно приоритетных комиссий заполняется до первой покупки, а не лениво на пути отправки
+    if solana_service.PRIORITY_FEE_ENABLED:
+        solana_service.fee_oracle.start()
+    
+    # Реестр отслеживаемых токенов
+    tracked_tokens = TokenRegistry(
+        REGISTRY_MAX_SIZE,
+        TOKEN_TTL,
+        TOKEN_INACTIVITY_TIMEOUT,
+        TERMINAL_TOKEN_TTL
+    )
     
     # Время последней проверки новых токенов
     last_new_tokens_check = 0
     
+    # Пул для параллельной проверки миграции
+    checker = MigrationChecker(check_migration, CHECK_CONCURRENCY, CHECK_CYCLE_DEADLINE)
+    
+    # Расписание опроса токенов в зависимости от скорости миграции
+    scheduler = PollScheduler(
+        MIGRATION_THRESHOLD,
+        POLL_MIN_INTERVAL,
+        POLL_MAX_INTERVAL,
+        CHECK_INTERVAL,
+        POLL_NEAR_MARGIN
+    )
+    
+    # Потоковые подписки на новые токены (опрос /tokens/new остается запасным вариантом)
+    new_tokens_queue = queue.Queue()
+    new_tokens_event = threading.Event()
+    
+    def on_stream_token(platform, token):
+        new_tokens_queue.put((platform, token))
+        new_tokens_event.set()
+    
+    streams = {}
+    for platform, stream_url in TOKEN_STREAM_URLS.items():
+        if stream_url:
+            streams[platform] = TokenStream(stream_url, platform, on_stream_token)
+            streams[platform].start()
+    
     while not stop_monitoring:
         try:
             current_time = time.time()
             
-            # Проверяем новые токены каждые 10 секунд
+            # Забираем токены, пришедшие из потоков
+            stream_tokens = {}
+            while True:
+                try:
+                    platform, token = new_tokens_queue.get_nowait()
+                except queue.Empty:
+                    break
+                stream_tokens.setdefault(platform, []).append(token)
+            
+            # Токены платформы удаляются из очереди только после успешного добавления:
+            # при ошибке необработанные возвращаются в очередь и попадут в следующий цикл
+            while stream_tokens:
+                platform, tokens = next(iter(stream_tokens.items()))
+                try:
+                    add_new_tokens(tracked_tokens, scheduler, tokens, platform)
+                except Exception:
+                    for platform, tokens in stream_tokens.items():
+                        for token in tokens:
+                            new_tokens_queue.put((platform, token))
+                    raise
+                del stream_tokens[platform]
+            
+            # Проверяем новые токены каждые 10 секунд (опрос, если поток платформы не подключен)
             if current_time - last_new_tokens_check > 10:
-                # Получаем новые токены с pump.fun
-                pump_tokens = solana_service.get_new_pumpfun_tokens()
-                if pump_tokens["success"]:
-                    for token in pump_tokens["tokens"]:
-                        if token["address"] not in tracked_tokens:
-                            # Добавляем токен в БД или обновляем существующий
-                            existing_token = Token.find_by_address(token["address"])
-                            
-                            if not existing_token:
-                                Token.create(
-                                    token["address"],
-                                    token["name"],
-                                    token["symbol"],
-                                    "pump.fun",
-                                    0,
-                                    "tracking"
-                                )
-                            
-                            # Добавляем в отслеживаемые
-                            tracked_tokens[token["address"]] = {
-                                "name": token["name"],
-                                "symbol": token["symbol"],
-                                "platform": "pump.fun",
-                                "last_migration_percentage": 0,
-                                "time_added": datetime.now(),
-                                "status": "tracking"
-                            }
-                            
-                            print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
-                
-                # Получаем новые токены с Raydium
-                raydium_tokens = solana_service.get_new_raydium_tokens()
-                if raydium_tokens["success"]:
-                    for token in raydium_tokens["tokens"]:
-                        if token["address"] not in tracked_tokens:
-                            # Добавляем токен в БД или обновляем существующий
-                            existing_token = Token.find_by_address(token["address"])
-                            
-                            if not existing_token:
-                                Token.create(
-                                    token["address"],
-                                    token["name"],
-                                    token["symbol"],
-                                    "raydium",
-                                    0,
-                                    "tracking"
-                                )
-                            
-                            # Добавляем в отслеживаемые
-                            tracked_tokens[token["address"]] = {
-                                "name": token["name"],
-                                "symbol": token["symbol"],
-                                "platform": "raydium",
-                                "last_migration_percentage": 0,
-                                "time_added": datetime.now(),
-                                "status": "tracking"
-                            }
-                            
-                            print(f"Новый токен добавлен для отслеживания: {token['name']} ({token['symbol']})")
+                for platform, get_new_tokens in NEW_TOKEN_SOURCES:
+                    stream = streams.get(platform)
+                    if stream is not None and stream.connected:
+                        continue
+                    
+                    # API платформы недоступно
+                    if not breakers[platform].allow():
+                        continue
+                    
+                    new_tokens = get_new_tokens()
+                    if new_tokens["success"]:
+                        breakers[platform].record_success()
+                        add_new_tokens(tracked_tokens, scheduler, new_tokens["tokens"], platform)
+                    elif new_tokens.get("upstream_error"):
+                        breakers[platform].record_failure()
                 
                 last_new_tokens_check = current_time
-            
-            # Проверяем миграцию для каждого отслеживаемого токена
-            for token_address, token_info in list(tracked_tokens.items()):
-                # Пропускаем токены, которые не в статусе отслеживания
-                if token_info["status"] != "tracking":
-                    continue
                 
-                # Проверяем миграцию в зависимости от платформы
-                migration_result = None
-                if token_info["platform"] == "pump.fun":
-                    migration_result = solana_service.check_token_migration(token_address)
-                elif token_info["platform"] == "raydium":
-                    migration_result = solana_service.check_raydium_token_migration(token_address)
+                # Вытесняем устаревшие и застывшие токены
+                evicted_tokens = tracked_tokens.evict_expired()
+                for token_address in evicted_tokens:
+                    scheduler.remove(token_address)
+                    Token.update_status(token_address, "expired")
                 
-                if migration_result and migration_result["success"]:
-                    # Обновляем процент миграции
-                    token_info["last_migration_percentage"] = migration_result["migration_percentage"]
+                if evicted_tokens:
+                    print(f"Вытеснено токенов: {len(evicted_tokens)}, статистика реестра: {tracked_tokens.stats()}")
+            
+            # Проверяем миграцию токенов, время опроса которых наступило
+            due_tokens = scheduler.pop_due()
+            try:
+                tokens_to_check = []
+                for token_address in due_tokens:
+                    token_info = tracked_tokens.get(token_address)
+                    if token_info is None or token_info["status"] != "tracking":
+                        scheduler.remove(token_address)
+                        continue
                     
-                    # Обновляем в БД
-                    Token.update_migration_percentage(token_address, migration_result["migration_percentage"])
+                    # API платформы недоступно: откладываем проверку до пробного запроса
+                    breaker = breakers.get(token_info["platform"])
+                    if breaker is not None and not breaker.allow():
+                        scheduler.retry(token_address, max(breaker.retry_in(), POLL_MIN_INTERVAL))
+                        continue
                     
-                    print(f"Токен {token_info['name']} ({token_info['symbol']}): миграция {migration_result['migration_percentage']}%")
+                    tokens_to_check.append((token_address, token_info["platform"]))
+                
+                checked = set()
+                threshold_reached = False
+                for token_address, migration_result in checker.check_all(tokens_to_check):
+                    checked.add(token_address)
+                    token_info = tracked_tokens.get(token_address)
                     
-                    # Если миграция достигла порога, покупаем токен для всех активных пользователей
-                    if migration_result["migration_percentage"] >= MIGRATION_THRESHOLD:
-                        token_info["status"] = "buying"
-                        
-                        # Обновляем статус в БД
-                        Token.update_status(token_address, "buying")
-                        
-                        # Получаем всех активных пользователей
-                        active_users = User.get_all_active()
-                        
-                        for user in active_users:
-                            # Покупаем токен для пользователя
-                            buy_token_for_user(
-                                user,
-                                token_address,
-                                token_info["name"],
-                                token_info["symbol"],
-                                token_info["platform"]
-                            )
-                        
-                        # Меняем статус токена на "bought"
-                        token_info["status"] = "bought"
-                        Token.update_status(token_address, "bought")
+                    # Пропускаем токены, которые не в статусе отслеживания
+                    if token_info is None or token_info["status"] != "tracking":
+                        scheduler.remove(token_address)
+                        continue
+                    
+                    process_migration_result(tracked_tokens, token_address, migration_result)
+                    
+                    # Планируем следующий опрос по новому проценту и скорости миграции
+                    if migration_result and migration_result["success"]:
+                        negative_cache.record_success(token_address)
+                        scheduler.record(token_address, migration_result["migration_percentage"])
+                        threshold_reached = threshold_reached or migration_result["migration_percentage"] >= MIGRATION_THRESHOLD
+                    else:
+                        schedule_failed_check(scheduler, token_address, migration_result)
+                
+                # Токены без результата (дедлайн цикла или проверка еще идет) опрашиваем повторно
+                for token_address, platform in tokens_to_check:
+                    if token_address not in checked:
+                        scheduler.retry(token_address)
+                
+                # Покупаем токены, достигшие порога миграции (сканирование реестра только если порог был достигнут)
+                if threshold_reached:
+                    for token_address in buy_crossed_tokens(tracked_tokens):
+                        scheduler.remove(token_address)
             
-            # Спим перед следующей проверкой
-            time.sleep(CHECK_INTERVAL)
+            finally:
+                # Извлеченные токены, которые не успели перепланировать из-за ошибки, возвращаем в очередь
+                scheduler.restore(due_tokens)
+            
+            # Ждем ближайшего запланированного опроса, проверки новых токенов или токена из потока
+            sleep_time = max(0, 10 - (time.time() - last_new_tokens_check))
+            next_due = scheduler.next_due_in()
+            if next_due is not None:
+                sleep_time = min(sleep_time, next_due)
+            new_tokens_event.wait(max(sleep_time, 0.05))
+            new_tokens_event.clear()
             
         except Exception as e:
             print(f"Ошибка в цикле мониторинга: {str(e)}")
             time.sleep(CHECK_INTERVAL)
+    
+    checker.shutdown()
+    
+    # Записываем накопленные проценты миграции
+    Token.flush_migration_updates()
+    
+    for stream in streams.values():
+        stream.stop()
 
 def start_monitoring():
     """Запуск мониторинга токенов в отдельном потоке"""
@@ -278,5 +537,7 @@ __all__ = [
     'start_monitoring',
     'stop_monitoring_thread',
     'buy_token_for_user',
+    'execute_buy',
+    'record_purchase',
     'sell_token_for_user'
 ]
\ No newline at end of file
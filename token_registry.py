@@ -0,0 +1,349 @@
+# token_registry.py - Реестр отслеживаемых токенов с ограничением размера и вытеснением
+
+import operator
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+# numpy необязателен: с ним сканирование колонок векторизуется
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Коды платформ и статусов (новые значения добавляются при первом появлении)
+PLATFORMS = ["pump.fun", "raydium"]
+STATUSES = ["tracking", "buying", "bought", "expired", "evicted"]
+
+# Код статуса свободной строки таблицы
+FREE_ROW = 255
+
+# Статусы, которые реестр помнит без ограничения размера и срока: купленный токен не должен отслеживаться повторно
+PINNED_STATUSES = ("buying", "bought")
+
+class TokenView:
+    """Представление строки таблицы с доступом как к словарю (token_info["name"] и т.д.)"""
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.table.get_field(self.row, key)
+
+    def __setitem__(self, key, value):
+        self.table.set_field(self.row, key, value)
+
+    def __contains__(self, key):
+        return key in TokenStateTable.FIELDS
+
+    def get(self, key, default=None):
+        if key not in TokenStateTable.FIELDS:
+            return default
+        return self.table.get_field(self.row, key)
+
+class TokenStateTable:
+    """Компактное хранение состояния токенов по колонкам: массивы чисел и коды вместо словарей"""
+
+    FIELDS = ("address", "name", "symbol", "platform", "status", "last_migration_percentage", "time_added")
+
+    def __init__(self):
+        self.addresses = []
+        self.names = []
+        self.symbols = []
+        self.platforms = array("B")
+        self.statuses = array("B")
+        self.percentages = array("d")
+
+        # Время добавления (unix-время) и монотонные отметки для вытеснения
+        self.time_added = array("d")
+        self.added_at = array("d")
+        self.last_activity = array("d")
+
+        # Освободившиеся строки используются повторно
+        self.free_rows = []
+
+        self.platform_names = list(PLATFORMS)
+        self.status_names = list(STATUSES)
+
+    def __len__(self):
+        return len(self.addresses) - len(self.free_rows)
+
+    @staticmethod
+    def _encode(names, value):
+        """Код строкового значения (платформы или статуса)"""
+        try:
+            return names.index(value)
+        except ValueError:
+            names.append(sys.intern(value))
+            return len(names) - 1
+
+    def insert(self, token_address, token_info, now):
+        """Запись токена в свободную или новую строку"""
+        time_added = token_info.get("time_added")
+        if isinstance(time_added, datetime):
+            time_added = time_added.timestamp()
+        elif time_added is None:
+            time_added = time.time()
+
+        values = (
+            token_address,
+            token_info["name"],
+            sys.intern(token_info["symbol"]),
+            self._encode(self.platform_names, token_info["platform"]),
+            self._encode(self.status_names, token_info.get("status", "tracking")),
+            float(token_info.get("last_migration_percentage", 0)),
+            time_added,
+            now,
+            now
+        )
+        columns = (
+            self.addresses, self.names, self.symbols, self.platforms, self.statuses,
+            self.percentages, self.time_added, self.added_at, self.last_activity
+        )
+
+        if self.free_rows:
+            row = self.free_rows.pop()
+            for column, value in zip(columns, values):
+                column[row] = value
+        else:
+            row = len(self.addresses)
+            for column, value in zip(columns, values):
+                column.append(value)
+
+        return row
+
+    def release(self, row):
+        """Освобождение строки"""
+        self.addresses[row] = None
+        self.names[row] = None
+        self.symbols[row] = None
+        self.statuses[row] = FREE_ROW
+        self.percentages[row] = -1
+        self.free_rows.append(row)
+
+    def get_field(self, row, key):
+        """Чтение поля строки"""
+        if key == "address":
+            return self.addresses[row]
+        if key == "name":
+            return self.names[row]
+        if key == "symbol":
+            return self.symbols[row]
+        if key == "platform":
+            return self.platform_names[self.platforms[row]]
+        if key == "status":
+            return self.status_names[self.statuses[row]]
+        if key == "last_migration_percentage":
+            return self.percentages[row]
+        if key == "time_added":
+            return datetime.fromtimestamp(self.time_added[row])
+        raise KeyError(key)
+
+    def set_field(self, row, key, value):
+        """Изменение поля строки"""
+        if key == "status":
+            self.statuses[row] = self._encode(self.status_names, value)
+        elif key == "last_migration_percentage":
+            self.percentages[row] = value
+        elif key == "name":
+            self.names[row] = value
+        elif key == "symbol":
+            self.symbols[row] = sys.intern(value)
+        else:
+            raise KeyError(key)
+
+    def scan(self, column, compare, value, status="tracking"):
+        """Строки с указанным статусом, для которых compare(колонка, value) истинно"""
+        status_code = self._encode(self.status_names, status)
+
+        if numpy is not None and self.addresses:
+            statuses = numpy.frombuffer(self.statuses, dtype=numpy.uint8)
+            values = numpy.frombuffer(column, dtype=numpy.float64)
+            return numpy.flatnonzero((statuses == status_code) & compare(values, value)).tolist()
+
+        return [
+            row for row, (row_status, row_value) in enumerate(zip(self.statuses, column))
+            if row_status == status_code and compare(row_value, value)
+        ]
+
+    def rows_at_or_above(self, threshold, status="tracking"):
+        """Векторное сравнение колонки процентов с порогом"""
+        return self.scan(self.percentages, operator.ge, threshold, status)
+
+    def rows_older_than(self, column, cutoff, status="tracking"):
+        """Строки, у которых монотонная отметка в колонке меньше порога"""
+        return self.scan(column, operator.lt, cutoff, status)
+
+    def memory_usage(self):
+        """Оценка памяти под колонки и строки в байтах"""
+        total = 0
+        for column in (self.platforms, self.statuses, self.percentages,
+                       self.time_added, self.added_at, self.last_activity):
+            total += sys.getsizeof(column)
+        for column in (self.addresses, self.names, self.symbols):
+            total += sys.getsizeof(column)
+            total += sum(sys.getsizeof(value) for value in column if value is not None)
+        return total
+
+class TokenRegistry:
+    """Реестр токенов: живые токены отдельно от завершенных, вытеснение по TTL, бездействию и размеру"""
+
+    def __init__(self, max_size=10000, ttl=86400, inactivity_timeout=3600, terminal_ttl=86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.inactivity_timeout = inactivity_timeout
+        self.terminal_ttl = terminal_ttl
+
+        # Живые токены: адрес -> строка таблицы
+        self.table = TokenStateTable()
+        self.rows = {}
+
+        # Завершенные токены (вытеснены или истекли): адрес -> (статус, время), чтобы не добавлять их повторно
+        self.terminal = OrderedDict()
+
+        # Купленные токены: адрес -> (статус, время); не вытесняются ни по размеру, ни по terminal_ttl
+        self.pinned = {}
+
+        # Вытесненные при переполнении адреса, еще не обработанные владельцем реестра (планировщик, БД)
+        self.capacity_evicted = []
+
+        self.evictions = {
+            "ttl": 0,
+            "inactive": 0,
+            "capacity": 0,
+            "terminal": 0
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, token_address):
+        return token_address in self.rows or token_address in self.pinned or token_address in self.terminal
+
+    def get(self, token_address):
+        """Получение данных живого токена"""
+        row = self.rows.get(token_address)
+        if row is None:
+            return None
+        return TokenView(self.table, row)
+
+    def items(self):
+        """Живые токены (адрес, данные)"""
+        for token_address, row in list(self.rows.items()):
+            yield token_address, TokenView(self.table, row)
+
+    def add(self, token_address, token_info, now=None):
+        """Добавление токена; при переполнении вытесняются наименее активные токены"""
+        if token_address in self:
+            return False
+
+        now = time.monotonic() if now is None else now
+
+        if len(self.rows) >= self.max_size:
+            self._evict_least_active(now)
+
+        self.rows[token_address] = self.table.insert(token_address, token_info, now)
+        return True
+
+    def _evict_least_active(self, now):
+        """Вытеснение пачки (1% размера) наименее активных токенов"""
+        count = max(1, len(self.rows) - self.max_size + 1, self.max_size // 100)
+        last_activity = self.table.last_activity
+        rows = sorted(self.rows.values(), key=last_activity.__getitem__)[:count]
+
+        for row in rows:
+            token_address = self.table.addresses[row]
+            self._retire(token_address, "evicted", now)
+            self.capacity_evicted.append(token_address)
+            self.evictions["capacity"] += 1
+
+    def pop_capacity_evicted(self):
+        """Адреса, вытесненные при переполнении с прошлого вызова (их нужно убрать из планировщика и БД)"""
+        evicted, self.capacity_evicted = self.capacity_evicted, []
+        return evicted
+
+    def touch(self, token_address, percentage, now=None):
+        """Учет нового процента миграции; изменение процента продлевает жизнь токена"""
+        row = self.rows.get(token_address)
+        if row is None:
+            return
+
+        if percentage != self.table.percentages[row]:
+            self.table.last_activity[row] = time.monotonic() if now is None else now
+            self.table.percentages[row] = percentage
+
+    def mark_terminal(self, token_address, status, now=None):
+        """Перевод токена в завершенные (например, после покупки); неотслеживаемый токен просто запоминается"""
+        self._retire(token_address, status, time.monotonic() if now is None else now)
+
+    def _retire(self, token_address, status, now):
+        """Удаление токена из живых и запоминание его статуса"""
+        row = self.rows.pop(token_address, None)
+        if row is not None:
+            self.table.release(row)
+
+        if status in PINNED_STATUSES:
+            self.terminal.pop(token_address, None)
+            self.pinned[token_address] = (status, now)
+            return
+
+        self.terminal[token_address] = (status, now)
+        self.terminal.move_to_end(token_address)
+
+        while len(self.terminal) > self.max_size:
+            self.terminal.popitem(last=False)
+            self.evictions["terminal"] += 1
+
+    def crossed_threshold(self, threshold):
+        """Адреса отслеживаемых токенов, процент миграции которых достиг порога"""
+        return [self.table.addresses[row] for row in self.table.rows_at_or_above(threshold)]
+
+    def evict_expired(self, now=None):
+        """Вытеснение токенов с истекшим TTL или без изменений процента; возвращает вытесненные адреса"""
+        now = time.monotonic() if now is None else now
+        evicted = []
+
+        # Токены, которые отслеживаются слишком долго
+        for row in self.table.rows_older_than(self.table.added_at, now - self.ttl):
+            evicted.append(self.table.addresses[row])
+            self._retire(self.table.addresses[row], "expired", now)
+            self.evictions["ttl"] += 1
+
+        # Токены, процент которых давно не менялся
+        for row in self.table.rows_older_than(self.table.last_activity, now - self.inactivity_timeout):
+            evicted.append(self.table.addresses[row])
+            self._retire(self.table.addresses[row], "expired", now)
+            self.evictions["inactive"] += 1
+
+        # Завершенные токены забываем после terminal_ttl
+        while self.terminal:
+            token_address, (status, retired_at) = next(iter(self.terminal.items()))
+            if now - retired_at < self.terminal_ttl:
+                break
+            self.terminal.popitem(last=False)
+            self.evictions["terminal"] += 1
+
+        return evicted
+
+    def stats(self):
+        """Статистика реестра: размеры, память и количество вытеснений"""
+        return {
+            "live": len(self.rows),
+            "terminal": len(self.terminal),
+            "pinned": len(self.pinned),
+            "max_size": self.max_size,
+            "table_bytes": self.table.memory_usage(),
+            "evictions": dict(self.evictions)
+        }
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'TokenRegistry',
+    'TokenStateTable',
+    'TokenView'
+]
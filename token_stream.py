@@ -0,0 +1,139 @@
+# token_stream.py - Потоковое получение новых токенов (Server-Sent Events)
+
+import json
+import threading
+import requests
+
+class TokenStream:
+    """Постоянная SSE-подписка на новые токены с переподключением и продолжением с последнего события"""
+
+    def __init__(self, url, platform, on_token, reconnect_delay=1, max_reconnect_delay=30, read_timeout=60):
+        self.url = url
+        self.platform = platform
+        self.on_token = on_token
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.read_timeout = read_timeout
+
+        # Идентификатор последнего полученного события (для продолжения после переподключения)
+        self.last_event_id = None
+        self.connected = False
+        self.reconnects = 0
+        self.events_received = 0
+
+        self.stopped = threading.Event()
+        self.response = None
+        self.thread = None
+
+    def start(self):
+        """Запуск подписки в отдельном потоке"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name=f"token-stream-{self.platform}")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Остановка подписки"""
+        self.stopped.set()
+
+        # Закрываем соединение, чтобы прервать блокирующее чтение
+        response = self.response
+        if response is not None:
+            response.close()
+
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        """Цикл подключения: при обрыве переподключаемся с экспоненциальной задержкой"""
+        delay = self.reconnect_delay
+
+        while not self.stopped.is_set():
+            try:
+                headers = {"Accept": "text/event-stream", "Cache-Control": "no-cache"}
+                if self.last_event_id is not None:
+                    headers["Last-Event-ID"] = self.last_event_id
+
+                self.response = requests.get(self.url, headers=headers, stream=True, timeout=(5, self.read_timeout))
+
+                if self.response.status_code == 200:
+                    self.connected = True
+                    delay = self.reconnect_delay
+                    print(f"Подключен поток новых токенов {self.platform}: {self.url}")
+
+                    retry = self._consume(self.response)
+                    if retry is not None:
+                        delay = retry
+                else:
+                    print(f"Поток новых токенов {self.platform} вернул статус {self.response.status_code}")
+            except Exception as e:
+                if not self.stopped.is_set():
+                    print(f"Ошибка потока новых токенов {self.platform}: {str(e)}")
+            finally:
+                self.connected = False
+                if self.response is not None:
+                    self.response.close()
+                    self.response = None
+
+            if self.stopped.wait(delay):
+                break
+
+            self.reconnects += 1
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _consume(self, response):
+        """Разбор потока событий; возвращает задержку переподключения, если сервер ее указал"""
+        retry = None
+        event_id = None
+        data_lines = []
+
+        for line in response.iter_lines(decode_unicode=True):
+            if self.stopped.is_set():
+                break
+
+            # Пустая строка завершает событие
+            if not line:
+                if data_lines:
+                    if event_id is not None:
+                        self.last_event_id = event_id
+                    self._dispatch("\n".join(data_lines))
+                event_id = None
+                data_lines = []
+                continue
+
+            # Комментарии (keep-alive)
+            if line.startswith(":"):
+                continue
+
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+
+            if field == "data":
+                data_lines.append(value)
+            elif field == "id":
+                event_id = value
+            elif field == "retry" and value.isdigit():
+                retry = int(value) / 1000
+
+        return retry
+
+    def _dispatch(self, data):
+        """Передача токенов из события обработчику"""
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            print(f"Некорректное событие в потоке новых токенов {self.platform}: {data[:100]}")
+            return
+
+        tokens = payload if isinstance(payload, list) else [payload]
+        for token in tokens:
+            if isinstance(token, dict) and "address" in token:
+                self.events_received += 1
+                self.on_token(self.platform, token)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'TokenStream'
+]
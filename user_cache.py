@@ -0,0 +1,169 @@
+# user_cache.py - Кэш активных пользователей для торгового пути
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from pymongo.errors import PyMongoError
+
+from models import User
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Поля пользователя, необходимые для покупки, продажи и уведомлений
+TRADING_FIELDS = {
+    "username": 1,
+    "wallet_address": 1,
+    "wallet_private_key": 1,
+    "telegram_chat_id": 1,
+    "language": 1,
+    "active": 1,
+    "updated_at": 1
+}
+
+class ActiveUserCache:
+    """Активные пользователи в памяти; обновляются через change stream или опрос по updated_at"""
+
+    def __init__(self, get_collection, poll_interval=5, use_change_stream=True, full_reload_interval=300):
+        self.get_collection = get_collection
+        self.poll_interval = poll_interval
+        self.use_change_stream = use_change_stream
+        self.full_reload_interval = full_reload_interval
+
+        # Активные пользователи: _id -> документ с торговыми полями
+        self.users = {}
+        self.lock = threading.Lock()
+
+        self.loaded = False
+        self.watermark = None
+        self.last_full_reload = 0
+        self.mode = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def get_all(self):
+        """Список активных пользователей (при первом вызове загружается из БД)"""
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self._load()
+            self._ensure_thread()
+
+        with self.lock:
+            return list(self.users.values())
+
+    def invalidate(self):
+        """Полная перезагрузка кэша"""
+        with self.lock:
+            self._load()
+
+    def _load(self):
+        """Полная загрузка активных пользователей (вызывается под блокировкой)"""
+        started = datetime.now()
+        users = {}
+        for user in self.get_collection().find({"active": True}, TRADING_FIELDS):
+            users[user["_id"]] = user
+
+        self.users = users
+        self.watermark = started
+        self.last_full_reload = time.monotonic()
+        self.loaded = True
+
+    def _apply(self, user):
+        """Применение изменившегося документа пользователя"""
+        with self.lock:
+            if user.get("active"):
+                self.users[user["_id"]] = {key: user.get(key) for key in ("_id", *TRADING_FIELDS)}
+            else:
+                self.users.pop(user["_id"], None)
+
+    def _ensure_thread(self):
+        """Запуск фонового обновления кэша"""
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="active-user-cache")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        """Change stream, а если он недоступен (нет replica set) - опрос по updated_at"""
+        if self.use_change_stream:
+            try:
+                self._watch()
+                return
+            except PyMongoError as e:
+                print(f"Change stream пользователей недоступен, переход на опрос: {str(e)}")
+
+        self._poll()
+
+    def _watch(self):
+        """Получение изменений пользователей через change stream"""
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+
+        with self.get_collection().watch(pipeline, full_document="updateLookup") as stream:
+            self.mode = "change_stream"
+
+            # Изменения между первичной загрузкой и открытием потока
+            self.invalidate()
+
+            while not self.stopped.is_set():
+                change = stream.try_next()
+                if change is None:
+                    self.stopped.wait(0.1)
+                    continue
+
+                if change["operationType"] == "delete":
+                    with self.lock:
+                        self.users.pop(change["documentKey"]["_id"], None)
+                elif change.get("fullDocument"):
+                    self._apply(change["fullDocument"])
+
+    def _poll(self):
+        """Опрос пользователей, измененных после последней отметки updated_at"""
+        self.mode = "polling"
+
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                # Периодическая полная перезагрузка (удаленные документы опросом не видны)
+                if time.monotonic() - self.last_full_reload > self.full_reload_interval:
+                    self.invalidate()
+                    continue
+
+                # Небольшое перекрытие, чтобы не пропустить записи с той же отметкой времени
+                since = self.watermark - timedelta(seconds=1)
+                polled_at = datetime.now()
+
+                for user in self.get_collection().find({"updated_at": {"$gt": since}}, TRADING_FIELDS):
+                    self._apply(user)
+
+                self.watermark = polled_at
+            except Exception as e:
+                print(f"Ошибка при обновлении кэша пользователей: {str(e)}")
+
+    def stop(self):
+        """Остановка фонового обновления"""
+        self.stopped.set()
+
+    def stats(self):
+        """Размер кэша и режим обновления"""
+        with self.lock:
+            return {
+                "active_users": len(self.users),
+                "mode": self.mode,
+                "watermark": self.watermark
+            }
+
+# Общий кэш активных пользователей
+active_user_cache = ActiveUserCache(
+    lambda: User.collection,
+    float(os.environ.get("USER_CACHE_POLL_INTERVAL", 5)),
+    os.environ.get("USER_CACHE_CHANGE_STREAM", "true").lower() == "true"
+)
+
+# Экспортируем классы для использования в других модулях
+__all__ = [
+    'ActiveUserCache',
+    'active_user_cache'
+]